@@ -1,3 +1,37 @@
-from talklib.show import TLShow
-from talklib.notify import Syslog
-from talklib.ffmpeg import FFMPEG
\ No newline at end of file
+'''
+The classes below are imported the first time they are used, not when talklib is imported
+(PEP 562). Importing everything up front pulls in requests, aiohttp, ffmpeg and so on,
+and every show script would pay for all of it before doing anything.
+'''
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from talklib.show import TLShow
+    from talklib.batch import TLShowBatch
+    from talklib.poll import FeedPoller
+    from talklib.notify import Syslog
+    from talklib.ffmpeg import FFMPEG
+
+_lazy = {
+    'TLShow': 'talklib.show',
+    'TLShowBatch': 'talklib.batch',
+    'FeedPoller': 'talklib.poll',
+    'Syslog': 'talklib.notify',
+    'FFMPEG': 'talklib.ffmpeg',
+}
+
+__all__ = list(_lazy)
+
+
+def __getattr__(name: str):
+    if name not in _lazy:
+        raise AttributeError(f"module 'talklib' has no attribute '{name}'")
+    value = getattr(import_module(_lazy[name]), name)
+    globals()[name] = value  # so we only come through here once per name
+    return value
+
+
+def __dir__() -> list:
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,124 @@
+'''
+Run many TLShow instances at once.
+
+Each show is still processed exactly as it would be on its own (TLShow.run()),
+but the shows are handed to a pool of workers so one slow download or
+conversion doesn't hold up every show queued behind it.
+'''
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+import time
+
+from talklib.show import RunResult, TLShow
+
+
+@dataclass
+class ShowResult:
+    '''the outcome of a single show in a batch'''
+    show: str
+    succeeded: bool
+    seconds: float
+    error: Exception = None
+    run: RunResult = None  # what the show did, if it succeeded
+
+
+def _run_show(show: TLShow) -> ShowResult:
+    '''
+    run one show and report what happened.
+    Any exception is caught here so a problem with one show
+    never stops the rest of the batch.
+    '''
+    start = time.monotonic()
+    try:
+        run = show.run()
+        return ShowResult(show=show.show, succeeded=True, seconds=time.monotonic() - start, run=run)
+    except Exception as error:
+        return ShowResult(show=show.show, succeeded=False, seconds=time.monotonic() - start, error=error)
+
+
+class TLShowBatch:
+    '''
+    Process a list of configured TLShow instances concurrently.
+
+    max_workers is the global limit on how many shows run at the same time.
+    By default shows run on threads, which suits us since most of the time is
+    spent waiting on the network and on ffmpeg. Set use_processes to True to
+    give every show its own process instead.
+
+    Nobody is watching a batch, so every show is run headless: a failure
+    raises straight away instead of waiting for someone to press enter.
+
+    Shows on threads share one process, so their profiles (see talklib.profiling)
+    would be mixed up together. Profiling is turned off for them; it still works with use_processes.
+    '''
+    def __init__(self,
+                 shows: list = None,
+                 max_workers: int = 4,
+                 use_processes: bool = False,
+                 ):
+
+        self.shows: list = shows if shows is not None else []
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.results: list = []
+
+    def add(self, show: TLShow) -> None:
+        '''add a configured show to the batch'''
+        self.shows.append(show)
+
+    def __check_shows_are_valid(self):
+        '''
+        every show downloads and converts into the current directory using its show_filename,
+        so two shows with the same filename would clobber each other's files.
+        '''
+        if not (type(self.max_workers) == int and self.max_workers > 0):
+            raise ValueError(f'Sorry, max_workers must be a whole number above 0, but you used {self.max_workers}.')
+
+        seen = set()
+        for show in self.shows:
+            if not isinstance(show, TLShow):
+                raise TypeError(f'Sorry, every show in the batch must be a TLShow, but you used {type(show)}.')
+            if show.show_filename in seen:
+                raise ValueError(f"Sorry, more than one show in the batch uses the filename '{show.show_filename}'.")
+            seen.add(show.show_filename)
+
+    def run(self) -> list:
+        '''run every show in the batch and return a list of ShowResult, in the same order as self.shows'''
+        self.__check_shows_are_valid()
+
+        for show in self.shows:
+            show.headless = True
+            if show.profile_dir and not self.use_processes:
+                print(f"{show.show}: profiling is turned off in a batch running on threads. Use use_processes, or profile the show on its own.")
+                show.profile_dir = None
+
+        pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        results = [None] * len(self.shows)
+        start = time.monotonic()
+        with pool(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(_run_show, show): index for index, show in enumerate(self.shows)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as error:
+                    # the show never got to report for itself: with use_processes it couldn't be
+                    # pickled (E.G. a lambda in run_hooks), or its worker process died
+                    results[index] = ShowResult(show=self.shows[index].show, succeeded=False,
+                                                seconds=time.monotonic() - start, error=error)
+
+        self.results = results
+        print(self.report())
+        return results
+
+    def report(self) -> str:
+        '''a short, human-readable summary of the last run'''
+        failed = [result for result in self.results if not result.succeeded]
+        lines = [f'{len(self.results) - len(failed)} of {len(self.results)} show(s) succeeded.']
+        for result in self.results:
+            status = 'OK' if result.succeeded else f'FAILED ({result.error})'
+            if result.run and result.run.unchanged:
+                status = 'unchanged, nothing to do'
+            lines.append(f'{result.show}: {status} in {result.seconds:.1f} seconds')
+        return '\n'.join(lines)
@@ -0,0 +1,58 @@
+'''
+Small on-disk caches used by the rest of the package.
+
+Everything lives under one directory (EV().cache_dir). Each cache is a
+subfolder, and each entry is a JSON file named after a hash of its key.
+Entries are written with atomic_write, so several shows running at once never
+see a half-written entry.
+'''
+
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import tempfile
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w', prefix: str = None):
+    '''
+    open a temporary file next to path, and rename it to path when the block ends, so
+    nobody ever reads half a file. If the block raises, path is left as it was.
+    '''
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=prefix, suffix='.tmp')
+    try:
+        with os.fdopen(handle, mode=mode, encoding=None if 'b' in mode else 'utf-8') as file:
+            yield file
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class JSONCache:
+    def __init__(self, directory: str, name: str):
+        self.directory = os.path.join(directory, name)
+
+    def __path(self, key: str) -> str:
+        filename = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{filename}.json')
+
+    def get(self, key: str) -> dict | None:
+        '''return the stored entry, or None if there isn't one (or it can't be read)'''
+        try:
+            with open(self.__path(key), mode='r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_write(self.__path(key)) as file:
+            json.dump(value, file)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.__path(key))
+        except FileNotFoundError:
+            pass
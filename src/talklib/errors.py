@@ -0,0 +1,38 @@
+'''
+The exceptions TLShow raises when a show can't be processed.
+
+They all derive from ShowError, so catching that catches any of them. The message
+is the same one sent out in the notifications.
+'''
+
+
+class ShowError(Exception):
+    '''the show could not be processed'''
+
+
+class InvalidAttributeError(ShowError):
+    '''an attribute is missing, the wrong type, or conflicts with another one'''
+
+
+class FeedError(ShowError):
+    '''the RSS feed could not be fetched, or doesn't contain an episode'''
+
+
+class FeedNotUpdatedError(ShowError):
+    '''today's episode hasn't been posted to the feed yet'''
+
+
+class DownloadError(ShowError):
+    '''the audio didn't download completely, or the file is empty'''
+
+
+class ConversionError(ShowError):
+    '''FFmpeg could not convert the audio'''
+
+
+class TransferError(ShowError):
+    '''the converted file didn't arrive intact at every destination'''
+
+
+class SourceFileNotFoundError(ShowError, FileNotFoundError):
+    '''the local (or downloaded) audio file doesn't exist'''
@@ -5,24 +5,115 @@ They'll be imported into the other files in this package.
 We're using the file so we have one central place from which
 to reference them.
 
-If you're installing the talklib module on a PC for the first time, 
+If you're installing the talklib module on a PC for the first time,
 make sure all of these are declared in the PC's environment variables.
+Alternatively, put them in a TOML file (same names, E.G. syslog_server = "10.0.0.1")
+and point the talklib_config environment variable at it. Anything set in the
+environment wins over the file.
 
 If you need to change them, you probably want to change them at the PC level, not here.
+
+The variables are only read (and checked) once per process: EV() always hands back
+the same object, and it can't be changed. If you really need to pick up changes,
+call EV.reload().
 '''
 
 import os
+import sys
+import tempfile
+import threading
+
+# attribute: environment variable
+_REQUIRED = {
+    'syslog_host': 'syslog_server',  # ip of syslog server (PC with syslog software)
+    'fromEmail': 'fromEmail',  # from where should emails appear to come?
+    'toEmail': 'toEmail',  # to where should emails be sent?
+    'mail_server': 'mail_server_external',  # IP of mail server (ITS set this up for us)
+    'twilio_sid': 'twilio_sid',  # locate by logging in to Twilio website
+    'twilio_token': 'twilio_token',  # locate by logging in to Twilio website
+    'twilio_from': 'twilio_from',  # locate by logging in to Twilio website
+    'twilio_to': 'twilio_to',  # to where should texts/calls be sent
+    'icecast_user': 'icecast_user',  # our icecast username
+    'icecast_pass': 'icecast_pass',  # our icecast password
+}
+_DESTINATIONS = ('OnAirPC', 'ProductionPC')  # where should output files go?
+_CONFIG_FILE = 'talklib_config'  # optional. path to a TOML file with any of the above
+
+
+class MissingVariablesError(KeyError):
+    '''one or more required variables are set neither in the environment nor in the config file'''
+    def __init__(self, missing: list):
+        self.missing = missing
+        super().__init__(f'These environment variables are not set: {", ".join(missing)}')
+
+    def __str__(self) -> str:
+        return self.args[0]  # KeyError would otherwise show the message in quotes
+
+
+def _read_config_file(path: str) -> dict:
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:
+        import tomli as tomllib
+    with open(path, mode='rb') as file:
+        return tomllib.load(file)
+
 
 class EV:
-    def __init__(self):
-        self.destinations = [os.environ['OnAirPC'], os.environ['ProductionPC']]# where should output files go? MUST BE A LIST EVEN WITH ONLY ONE
-        self.syslog_host = os.environ["syslog_server"] # ip of syslog server (PC with syslog software)
-        self.fromEmail = os.environ['fromEmail']  # from where should emails appear to come?
-        self.toEmail = os.environ['toEmail']  # to where should emails be sent?
-        self.mail_server = os.environ["mail_server_external"]  # IP of mail server (ITS set this up for us)
-        self.twilio_sid = os.environ['twilio_sid'] # locate by logging in to Twilio website
-        self.twilio_token = os.environ['twilio_token']# locate by logging in to Twilio website
-        self.twilio_from = os.environ['twilio_from'] # locate by logging in to Twilio website
-        self.twilio_to = os.environ['twilio_to'] # to where should texts/calls be sent
-        self.icecast_user = os.environ['icecast_user'] # our icecast username
-        self.icecast_pass = os.environ['icecast_pass'] # our icecast password
\ No newline at end of file
+    __slots__ = ('destinations', 'cache_dir', 'profile_dir', *_REQUIRED)
+
+    __instance: 'EV' = None
+    __lock = threading.Lock()
+
+    def __new__(cls) -> 'EV':
+        with cls.__lock:
+            if cls.__instance is None:
+                cls.__instance = cls.__load()
+            return cls.__instance
+
+    @classmethod
+    def reload(cls) -> 'EV':
+        '''read the variables again. Anything already holding the old EV keeps it.'''
+        with cls.__lock:
+            cls.__instance = cls.__load()
+            return cls.__instance
+
+    @classmethod
+    def __load(cls) -> 'EV':
+        settings = dict(os.environ)
+        if settings.get(_CONFIG_FILE):
+            settings = {**{key: str(value) for key, value in _read_config_file(settings[_CONFIG_FILE]).items()}, **settings}
+
+        missing = [name for name in (*_DESTINATIONS, *_REQUIRED.values()) if name not in settings]
+        if missing:
+            raise MissingVariablesError(missing)
+
+        values = {attribute: settings[name] for attribute, name in _REQUIRED.items()}
+        values['destinations'] = tuple(settings[name] for name in _DESTINATIONS)
+        values['cache_dir'] = settings.get('talklib_cache_dir', os.path.join(tempfile.gettempdir(), 'talklib'))  # optional. where to keep cached feeds, etc.
+        values['profile_dir'] = settings.get('talklib_profile_dir')  # optional. profile every run (see talklib.profiling)
+        return cls._from_values(values)
+
+    @classmethod
+    def _from_values(cls, values: dict) -> 'EV':
+        ev = object.__new__(cls)
+        for attribute, value in values.items():
+            object.__setattr__(ev, attribute, value)
+        return ev
+
+    def replace(self, **changes) -> 'EV':
+        '''a copy with some values changed (E.G. a different mail server for testing). EV() is unaffected.'''
+        return self._from_values({**{attribute: getattr(self, attribute) for attribute in self.__slots__}, **changes})
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'EV is read-only. Use replace() to get a copy with {name} changed.')
+
+    def __delattr__(self, name):
+        raise AttributeError('EV is read-only.')
+
+    def __reduce__(self):
+        # for pickling (E.G. sending a TLShow to another process)
+        return (self._from_values, ({attribute: getattr(self, attribute) for attribute in self.__slots__},))
+
+    def __repr__(self) -> str:
+        return f'EV(destinations={self.destinations}, syslog_host={self.syslog_host!r}, mail_server={self.mail_server!r})'
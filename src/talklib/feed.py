@@ -0,0 +1,102 @@
+'''
+Reading RSS feeds.
+
+We only ever care about the newest item in a feed: its date tells us
+whether today's episode has been posted, and its enclosure is the audio file.
+'''
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+import xml.etree.ElementTree as ET
+
+
+class FirstItemParser:
+    '''
+    Parse a feed a chunk at a time and stop as soon as the first <item> is complete.
+
+    The resulting root holds the channel's details and that first item only, so a
+    feed with years of back catalogue costs no more than one with a single episode.
+    Once feed() returns True there is no need to read (or download) any more of the feed.
+    '''
+    def __init__(self):
+        self.__parser = ET.XMLPullParser(events=('start', 'end'))
+        self.__parents = []  # the elements currently open, outermost first
+        self.root: ET.Element = None
+
+    def feed(self, chunk: bytes) -> bool:
+        '''add the next chunk of the feed. Returns True once we have the first item.'''
+        self.__parser.feed(chunk)
+        for event, element in self.__parser.read_events():
+            if event == 'start':
+                self.root = element if self.root is None else self.root
+                self.__parents.append(element)
+                continue
+            self.__parents.pop()
+            if element.tag == 'item':
+                # one chunk can hold many items and the parser has already added them
+                # to the tree. Drop everything after the one we want.
+                if self.__parents:
+                    channel = self.__parents[-1]
+                    del channel[list(channel).index(element) + 1:]
+                return True
+        return False
+
+    def close(self) -> ET.Element:
+        '''call when the feed ran out before we found an item. Raises if the document was cut short or isn't XML.'''
+        self.__parser.close()
+        return self.root
+
+
+def parse_first_item(chunks: Iterable[bytes]) -> ET.Element:
+    '''
+    Parse a feed incrementally from an iterable of bytes (E.G. a streamed response),
+    stopping as soon as the first <item> is complete. See FirstItemParser.
+    '''
+    parser = FirstItemParser()
+    for chunk in chunks:
+        if parser.feed(chunk):
+            return parser.root
+    return parser.close()
+
+
+@dataclass
+class Episode:
+    '''the newest item in an RSS feed'''
+    title: str
+    pub_date: str
+    url: str
+    length: int | None
+    type: str | None
+
+    @classmethod
+    def from_feed(cls, root: ET.Element) -> 'Episode':
+        '''build from a parsed feed. Raises ValueError if the feed has no items/enclosure.'''
+        item = root.find('channel/item')  # 'find' only returns the first match!
+        if item is None:
+            raise ValueError('the feed does not contain any items')
+        enclosure = item.find('enclosure')
+        if enclosure is None or not enclosure.get('url'):
+            raise ValueError('the newest item in the feed does not have an audio file (enclosure)')
+
+        length = enclosure.get('length')
+        try:
+            length = int(length)
+        except (TypeError, ValueError):
+            length = None
+
+        return cls(
+            title=item.findtext('title', default=''),
+            pub_date=item.findtext('pubDate', default=''),
+            url=enclosure.get('url'),
+            length=length,
+            type=enclosure.get('type'),
+        )
+
+    def is_from_today(self) -> bool:
+        '''
+        The format for pubDate is a standard format (E.G. 'Mon, 17 Oct 2022') set by
+        a standards organization. Most podcasts/RSS feeds follow this standard.
+        '''
+        today = datetime.now().strftime("%a, %d %b %Y")
+        return today in self.pub_date
@@ -1,5 +1,205 @@
+from dataclasses import asdict, dataclass, field
+import errno
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Iterable
+
 import ffmpeg
 
+from talklib.cache import atomic_write, JSONCache
+from talklib.registry import per_process
+from talklib.transfer import file_digest
+
+
+@dataclass
+class ConversionAnalysis:
+    '''what ffmpeg measured while converting (FFMPEG.analyze). Times are in seconds, levels of the converted audio'''
+    duration: float = None
+    integrated_loudness: float = None  # LUFS
+    loudness_range: float = None  # LU
+    true_peak: float = None  # dBFS
+    peak_level: float = None  # dBFS
+    rms_level: float = None  # dBFS
+    silences: list = field(default_factory=list)  # (start, end) of each silence
+
+    @property
+    def silence_seconds(self) -> float:
+        return sum(end - start for start, end in self.silences)
+
+
+_NUMBER = r'(-?(?:\d+(?:\.\d*)?|inf))'
+
+def parse_analysis(output: str, sample_rate: int) -> ConversionAnalysis:
+    '''read the astats, silencedetect and ebur128 results out of what ffmpeg printed (its stderr)'''
+    analysis = ConversionAnalysis()
+
+    # ebur128 prints a running total every 100 ms (at verbose level). Only the summary at the end counts
+    summary = output[output.rfind('Summary:'):] if 'Summary:' in output else ''
+    for name, pattern in (('integrated_loudness', rf'\bI:\s+{_NUMBER} LUFS'),
+                          ('loudness_range', rf'\bLRA:\s+{_NUMBER} LU\b'),
+                          ('true_peak', rf'\bPeak:\s+{_NUMBER} dBFS')):
+        if match := re.search(pattern, summary):
+            setattr(analysis, name, float(match.group(1)))
+
+    # astats prints each channel, then "Overall"
+    overall = output[output.rfind('] Overall'):] if '] Overall' in output else ''
+    for name, pattern in (('peak_level', rf'\] Peak level dB: {_NUMBER}'),
+                          ('rms_level', rf'\] RMS level dB: {_NUMBER}')):
+        if match := re.search(pattern, overall):
+            setattr(analysis, name, float(match.group(1)))
+
+    # how much was written. the final progress line ("size=... time=00:01:02.50 ...") is the output's length
+    times = re.findall(r'time=(\d+):(\d\d):(\d\d(?:\.\d+)?)', output)
+    if times:
+        hours, minutes, seconds = times[-1]
+        analysis.duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    elif match := re.search(r'\] Number of samples: (\d+)', overall):
+        analysis.duration = int(match.group(1)) / sample_rate
+
+    start = None
+    for kind, value in re.findall(r'silence_(start|end): ' + _NUMBER, output):
+        if kind == 'start':
+            start = float(value)
+        elif start is not None:
+            analysis.silences.append((start, float(value)))
+            start = None
+    if start is not None:  # silent right up to the end (older versions of ffmpeg don't print an end)
+        analysis.silences.append((start, analysis.duration if analysis.duration is not None else start))
+    return analysis
+
+
+# what loudnorm's first pass prints (print_format=json), and the options the second pass takes them as
+_MEASUREMENTS = {'input_i': 'measured_I', 'input_tp': 'measured_TP', 'input_lra': 'measured_LRA',
+                 'input_thresh': 'measured_thresh', 'target_offset': 'offset'}
+
+def parse_loudnorm(output: str) -> dict | None:
+    '''
+    the measurements from a loudnorm first pass, or None if there aren't any usable ones
+    (E.G. the input is silent, so its loudness is -inf and there's nothing to normalize)
+    '''
+    start, end = output.rfind('{'), output.rfind('}')
+    if start == -1 or end < start:
+        return None
+    try:
+        printed = json.loads(output[start:end + 1])
+        measured = {name: float(printed[name]) for name in _MEASUREMENTS}
+    except (ValueError, KeyError, TypeError):
+        return None
+    if not all(math.isfinite(value) for value in measured.values()):
+        return None
+    return measured
+
+
+def _reader_exited(error: OSError) -> bool:
+    '''
+    whether writing to (or closing) a pipe failed because the other end has gone.
+    That's BrokenPipeError, except on Windows, where it's EINVAL (subprocess checks for it too).
+    '''
+    return isinstance(error, BrokenPipeError) or error.errno == errno.EINVAL
+
+
+class OutputCache:
+    '''
+    Converted files, kept so converting the same audio the same way again (E.G. a rerun after a copy
+    failed) is just a copy. Each entry is named after a hash of the source's sha256 and the ffmpeg
+    arguments. What was measured during the conversion is kept with it, in a JSONCache (details/).
+
+    Entries not used for max_age seconds are removed, then the least recently used ones until
+    the whole cache fits in max_bytes. Using an entry counts as using it (its modified time is updated).
+    '''
+    def __init__(self, directory: str, max_bytes: int, max_age: int | float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__details = JSONCache(directory=directory, name='details')
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def key(digest: str, commands: list) -> str:
+        return hashlib.sha256(json.dumps([digest, commands]).encode('utf-8')).hexdigest()
+
+    def __path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f'{key}{extension}')
+
+    def get(self, key: str, extension: str, output_file: str) -> dict | None:
+        '''copy the entry to output_file and return what was stored with it, or None if there's no entry'''
+        path = self.__path(key, extension)
+        details = self.__details.get(key)
+        if details is not None:
+            try:
+                shutil.copyfile(path, output_file)
+                os.utime(path)
+            except OSError:
+                details = None
+        if details is None:
+            with self.__lock:
+                self.misses = self.misses + 1
+            return None
+        with self.__lock:
+            self.hits = self.hits + 1
+        return details
+
+    def set(self, key: str, extension: str, output_file: str, details: dict) -> None:
+        '''store a copy of output_file (and details), then evict whatever no longer fits'''
+        os.makedirs(self.directory, exist_ok=True)
+        self.__details.set(key, details)
+        with atomic_write(self.__path(key, extension), mode='wb') as file, open(output_file, mode='rb') as original:
+            shutil.copyfileobj(original, file)
+        self.evict()
+
+    def evict(self) -> int:
+        '''remove old entries, then the least recently used until the cache fits. Returns how many were removed'''
+        entries = []
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    name, extension = os.path.splitext(entry.name)
+                    if extension == '.tmp' or not entry.is_file():
+                        continue  # half written, or the details folder
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # another process evicted it
+                    entries.append((stat.st_mtime, stat.st_size, name, extension))
+        except FileNotFoundError:
+            return 0
+        entries.sort()  # least recently used first
+        total = sum(size for _, size, _, _ in entries)
+        oldest_allowed = time.time() - self.max_age
+        removed = 0
+        for used, size, name, extension in entries:
+            if used >= oldest_allowed and total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.__path(name, extension))
+            except FileNotFoundError:
+                pass
+            self.__details.delete(name)
+            total = total - size
+            removed = removed + 1
+        with self.__lock:
+            self.evictions = self.evictions + removed
+        return removed
+
+
+def get_output_cache(directory: str, max_bytes: int, max_age: int | float) -> OutputCache:
+    '''one OutputCache per folder, per process, so its counters add up across shows (E.G. in a TLShowBatch)'''
+    make = lambda: OutputCache(directory=directory, max_bytes=max_bytes, max_age=max_age)
+    cache = per_process(key=('output cache', directory), factory=make)
+    cache.max_bytes = max_bytes
+    cache.max_age = max_age
+    return cache
+
+
 class FFMPEG:
     def __init__(self, 
                 input_file: str = None,
@@ -7,7 +207,8 @@ class FFMPEG:
                 breakaway: int|float = 0,
                 compression_level: int|float = 21,
                 sample_rate: int = 44100,
-                audio_channels: int = 1
+                audio_channels: int = 1,
+                analyze: bool = False
                  ):
 
         self.input_file = input_file
@@ -16,11 +217,28 @@ class FFMPEG:
         self.compression_level = compression_level
         self.sample_rate = sample_rate
         self.audio_channels = audio_channels
+        self.analyze = analyze  # measure length, loudness and silence while converting. see self.analysis
+        self.two_pass: bool = False  # measure the loudness first, then normalize it in one linear step
+        self.cache_dir: str = None  # where to keep two_pass measurements and output_cache files
+        self.output_cache: bool = False  # keep converted files, so converting the same audio the same way again is just a copy
+        self.output_cache_max_bytes: int = 2 * 1024 ** 3
+        self.output_cache_max_age: int | float = 7 * 24 * 60 * 60  # seconds since an entry was last used
+        self.silence_threshold: int | float = -50  # dB. quieter than this counts as silence
+        self.silence_duration: int | float = 5  # seconds of silence before it is reported
+        self.stopped_early = False  # set by convert_stream when ffmpeg stopped reading before the input ran out
+        self.analysis: ConversionAnalysis = None  # set by convert and convert_stream when analyze is on
+        self.measurement: dict = None  # the loudness of the input, from the first pass of two_pass
+        self.measurement_cached: bool = False  # whether the measurement came from cache_dir instead of a first pass
+        self.output_cached: bool = False  # whether convert's output came from output_cache
 
     def __build_input_commands(self) -> dict:
         command = {}
         command.update({'hide_banner': None})
-        command.update({'loglevel': 'quiet'})
+        if self.analyze:
+            command.update({'loglevel': 'info'})  # the measurements are printed at info level
+            command.update({'nostats': None})
+        else:
+            command.update({'loglevel': 'quiet'})
         command.update({'filename': self.input_file})
 
         return command
@@ -29,7 +247,7 @@ class FFMPEG:
         command = {}
         command.update({'ar': self.sample_rate})
         command.update({'ac': self.audio_channels})
-        command.update({'af': f'loudnorm=I=-{self.compression_level}'})
+        command.update({'af': self.__build_filters()})
         if self.breakaway:
             command.update({'t': self.breakaway})
         command.update({'y': None})
@@ -37,6 +255,73 @@ class FFMPEG:
 
         return command
     
+    def __build_filters(self) -> str:
+        '''
+        loudnorm, then (if analyze is on) the measuring filters, which pass the audio through untouched.
+        loudnorm works at 192 kHz (in stereo, for a stereo source), so first convert to exactly what we write:
+        the output's sample rate, channels and 16 bit samples, in one step, as ffmpeg does by itself when we
+        aren't analyzing. Left to itself with filters in the way, ffmpeg downmixes without scaling and a stereo
+        source comes out about 3 dB louder. The breakaway is trimmed after that step (before it, the resampler
+        ends differently), so we measure the file we make and the file is the same either way.
+        '''
+        filters = [self.__build_loudnorm()]
+        if self.analyze:
+            layout = {1: 'mono', 2: 'stereo'}.get(self.audio_channels, f'{self.audio_channels}c')
+            filters.append(f'aformat=sample_fmts=s16:sample_rates={self.sample_rate}:channel_layouts={layout}')
+            if self.breakaway:
+                filters.append(f'atrim=duration={self.breakaway}')
+            filters.extend([
+                'astats',
+                f'silencedetect=noise={self.silence_threshold}dB:duration={self.silence_duration}',
+                'ebur128=peak=true:framelog=verbose',
+            ])
+        return ','.join(filters)
+
+    def __build_loudnorm(self) -> str:
+        loudnorm = f'loudnorm=I=-{self.compression_level}'
+        if self.two_pass and self.measurement:
+            measured = ':'.join(f'{option}={self.measurement[name]}' for name, option in _MEASUREMENTS.items())
+            loudnorm = f'{loudnorm}:{measured}:linear=true'
+        return loudnorm
+
+    def __measurement_key(self, digest: str) -> str:
+        '''the same audio, measured the same way. Anything that changes what the first pass sees is in here'''
+        return f'{digest}:loudnorm=I=-{self.compression_level}:breakaway={self.breakaway or 0}'
+
+    def measure_loudness(self, digest: str = None) -> dict | None:
+        '''
+        the first pass of two_pass: how loud input_file is. Stored in self.measurement (and cache_dir,
+        if set) and returned. None if loudnorm couldn't measure it, in which case we fall back to one pass.
+        digest is the input's sha256, if we already have it.
+        '''
+        self.measurement = None
+        self.measurement_cached = False
+        cache = key = None
+        if self.cache_dir:
+            cache = JSONCache(directory=self.cache_dir, name='loudnorm')
+            digest = digest or file_digest(self.input_file)[1]
+            key = self.__measurement_key(digest)
+            cached = cache.get(key)
+            if cached:
+                self.measurement = cached
+                self.measurement_cached = True
+                return self.measurement
+
+        input_commands = {'hide_banner': None, 'nostats': None, 'loglevel': 'info', 'filename': self.input_file}
+        if self.breakaway:
+            input_commands.update({'t': self.breakaway})
+        stream = ffmpeg.input(**input_commands)
+        stream = ffmpeg.output(stream, af=f'loudnorm=I=-{self.compression_level}:print_format=json', f='null', filename='-')
+        _, output = ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
+        self.measurement = parse_loudnorm(output.decode(errors='replace'))
+
+        if cache and self.measurement:
+            try:
+                cache.set(key, self.measurement)
+            except OSError:
+                pass  # we'll just measure it again next time
+        return self.measurement
+
     def get_commands(self):
         input_commands = self.__build_input_commands()
         output_commands = self.__build_output_commands()
@@ -45,15 +330,104 @@ class FFMPEG:
         ffmpeg_commands = ffmpeg.get_args(stream)
         return ffmpeg_commands
 
+    def get_output_cache(self) -> OutputCache | None:
+        if not (self.output_cache and self.cache_dir):
+            return None
+        return get_output_cache(directory=os.path.join(self.cache_dir, 'converted'),
+                                max_bytes=self.output_cache_max_bytes, max_age=self.output_cache_max_age)
+
+    def __output_cache_key(self, digest: str) -> str:
+        '''the input's contents and every argument, except where the input comes from and the output goes to'''
+        commands = [argument for argument in self.get_commands() if argument not in (self.input_file, self.output_file)]
+        return OutputCache.key(digest=digest, commands=commands)
+
     def convert(self):
-        '''convert file with ffmpeg and return filename'''
+        '''
+        convert file with ffmpeg and return filename. With analyze on, the measurements are in self.analysis.
+        With output_cache on, the same input converted the same way is copied from the cache instead.
+        '''
+        self.analysis = None
+        self.output_cached = False
+        cache = self.get_output_cache()
+        digest = file_digest(self.input_file)[1] if self.cache_dir and (cache or self.two_pass) else None
+        if self.two_pass:
+            self.measure_loudness(digest=digest)
+        if cache:
+            key = self.__output_cache_key(digest=digest)
+            extension = os.path.splitext(self.output_file)[1]
+            details = cache.get(key=key, extension=extension, output_file=self.output_file)
+            if details is not None:
+                self.output_cached = True
+                if details.get('analysis'):
+                    analysis = details['analysis']
+                    analysis['silences'] = [tuple(span) for span in analysis['silences']]
+                    self.analysis = ConversionAnalysis(**analysis)
+                return self.output_file
+
         input_commands = self.__build_input_commands()
         output_commands = self.__build_output_commands()
         stream = ffmpeg.input(**input_commands)
         stream = ffmpeg.output(stream, **output_commands)
-        ffmpeg.run(stream, capture_stdout=True)
+        _, output = ffmpeg.run(stream, capture_stdout=True, capture_stderr=self.analyze)
+        if self.analyze:
+            self.analysis = parse_analysis(output.decode(errors='replace'), sample_rate=self.sample_rate)
+        if cache:
+            try:
+                cache.set(key=key, extension=extension, output_file=self.output_file,
+                          details={'analysis': asdict(self.analysis) if self.analysis else None})
+            except OSError:
+                pass  # we'll just convert it again next time
         return self.output_file
     
+    def convert_stream(self, chunks: Iterable[bytes]) -> str:
+        '''
+        convert audio fed to ffmpeg's stdin (E.G. a download, as it arrives) and return filename.
+        Nothing is written to disk except the converted file.
+
+        If ffmpeg stops reading early (because breakaway was reached) we stop
+        feeding it and set self.stopped_early; the remaining chunks are never consumed.
+
+        The audio only goes by once, so two_pass can't measure it first. It's normalized in one pass instead.
+        output_cache isn't used either: we can't tell what the audio is until we've converted it.
+        '''
+        self.input_file = 'pipe:'
+        self.stopped_early = False
+        self.analysis = None
+        self.measurement = None
+        self.output_cached = False
+        input_commands = self.__build_input_commands()
+        output_commands = self.__build_output_commands()
+        stream = ffmpeg.input(**input_commands)
+        stream = ffmpeg.output(stream, **output_commands)
+        process = ffmpeg.run_async(stream, pipe_stdin=True, pipe_stderr=self.analyze)
+        output = []
+        if self.analyze:
+            # read stderr as it comes. If its pipe filled up, ffmpeg would stop reading stdin and we'd both wait forever
+            reader = threading.Thread(target=lambda: output.append(process.stderr.read()), daemon=True)
+            reader.start()
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except OSError as error:
+            if not _reader_exited(error):
+                raise
+            self.stopped_early = True  # ffmpeg has exited. the return code tells us whether that was on purpose
+        finally:
+            try:
+                process.stdin.close()
+            except OSError as error:
+                if not _reader_exited(error):
+                    raise
+            process.wait()
+            if self.analyze:
+                reader.join()
+        stderr = output[0] if output else None
+        if process.returncode != 0:
+            raise ffmpeg.Error('ffmpeg', None, stderr)
+        if self.analyze:
+            self.analysis = parse_analysis(stderr.decode(errors='replace'), sample_rate=self.sample_rate)
+        return self.output_file
+
     def get_length_in_minutes(self) -> float:
         duration = ffmpeg.probe(filename=self.input_file)
         duration = duration['format']['duration']
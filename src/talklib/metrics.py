@@ -0,0 +1,163 @@
+'''
+Timing a show's run, stage by stage (feed check, download, conversion, copying...).
+
+TLShow keeps a RunRecord of every run: how long each stage took, how many bytes it
+handled and whether it worked. The record can be handed to your own functions
+(TLShow.run_hooks), sent to syslog, appended to a JSON lines file, or written as a
+Prometheus textfile (for node_exporter's textfile collector), so a slow day stands out.
+'''
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+import json
+import os
+import threading
+import time
+
+from talklib.cache import atomic_write
+
+
+@dataclass
+class Stage:
+    '''one step of a run'''
+    name: str
+    seconds: float = 0
+    bytes: int = None  # how much data the stage handled, where that means something
+    succeeded: bool = True
+    error: str = None
+
+
+@dataclass
+class RunRecord:
+    '''everything we measured about one run of a show'''
+    show: str
+    started: float  # when the run started (seconds since the epoch)
+    seconds: float = 0
+    succeeded: bool = True
+    error: str = None
+    stages: list = field(default_factory=list)  # a Stage for each step, in the order they started
+
+    def stage_seconds(self) -> dict:
+        '''total seconds per stage name (a stage can happen more than once, E.G. notifications)'''
+        totals = {}
+        for stage in self.stages:
+            totals[stage.name] = totals.get(stage.name, 0) + stage.seconds
+        return totals
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(',', ':'))
+
+
+class RunRecorder:
+    '''
+    Builds a RunRecord. Wrap each step in `with recorder.stage(name):` and call finish() at the end.
+    Stages can be nested (E.G. notifications sent from inside a download); each is timed on its own.
+
+    Given a profiler (see talklib.profiling), each outermost stage is profiled as well.
+    The profiler reports its own problems; they never fail the stage.
+    '''
+    def __init__(self, show: str, profiler=None):
+        self.record = RunRecord(show=show, started=time.time())
+        self.profiler = profiler
+        self.__start = time.monotonic()
+        self.__open = []  # stages that haven't finished yet, innermost last
+
+    @contextmanager
+    def stage(self, name: str):
+        '''time the code in the with block. An exception marks the stage as failed, and is re-raised.'''
+        stage = Stage(name=name)
+        self.record.stages.append(stage)
+        profiling = self.__profile_enter(name) if self.profiler and not self.__open else None
+        self.__open.append(stage)
+        start = time.monotonic()
+        try:
+            yield stage
+        except BaseException as error:
+            stage.succeeded = False
+            stage.error = str(error)
+            raise
+        finally:
+            stage.seconds = time.monotonic() - start
+            self.__open.remove(stage)
+            if profiling:
+                self.__profile_exit(profiling)
+
+    def __profile_enter(self, name: str):
+        try:
+            return self.profiler.enter(name)
+        except Exception as error:
+            self.profiler.log(f'Unable to profile {name}: {error}')
+            return None
+
+    def __profile_exit(self, token) -> None:
+        try:
+            self.profiler.exit(token)
+        except Exception as error:
+            self.profiler.log(f'Unable to save the profile for {token[0]}: {error}')
+
+    def add_bytes(self, count: int) -> None:
+        '''add to the byte count of the innermost stage that is still running'''
+        if self.__open:
+            stage = self.__open[-1]
+            stage.bytes = (stage.bytes or 0) + count
+
+    def finish(self, error: BaseException = None) -> RunRecord:
+        self.record.seconds = time.monotonic() - self.__start
+        self.record.succeeded = error is None
+        self.record.error = None if error is None else str(error)
+        return self.record
+
+
+_jsonl_lock = threading.Lock()
+
+def append_jsonl(record: RunRecord, path: str) -> None:
+    '''add the record to a JSON lines file, one run per line'''
+    with _jsonl_lock:
+        with open(path, mode='a', encoding='utf-8') as file:
+            file.write(record.to_json() + '\n')
+
+
+def _label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def to_prometheus(record: RunRecord) -> str:
+    '''the record in the Prometheus text format'''
+    show = _label(record.show)
+    lines = [
+        '# HELP talklib_run_seconds How long the last run of the show took.',
+        '# TYPE talklib_run_seconds gauge',
+        f'talklib_run_seconds{{show="{show}"}} {record.seconds:.6f}',
+        '# HELP talklib_run_success Whether the last run of the show succeeded (1) or failed (0).',
+        '# TYPE talklib_run_success gauge',
+        f'talklib_run_success{{show="{show}"}} {int(record.succeeded)}',
+        '# HELP talklib_run_timestamp_seconds When the last run of the show started.',
+        '# TYPE talklib_run_timestamp_seconds gauge',
+        f'talklib_run_timestamp_seconds{{show="{show}"}} {record.started:.3f}',
+        '# HELP talklib_stage_seconds How long each stage of the last run took.',
+        '# TYPE talklib_stage_seconds gauge',
+    ]
+    for name, seconds in record.stage_seconds().items():
+        lines.append(f'talklib_stage_seconds{{show="{show}",stage="{_label(name)}"}} {seconds:.6f}')
+    lines.extend([
+        '# HELP talklib_stage_bytes How many bytes each stage of the last run handled.',
+        '# TYPE talklib_stage_bytes gauge',
+    ])
+    byte_counts = {}
+    for stage in record.stages:
+        if stage.bytes is not None:
+            byte_counts[stage.name] = byte_counts.get(stage.name, 0) + stage.bytes
+    for name, count in byte_counts.items():
+        lines.append(f'talklib_stage_bytes{{show="{show}",stage="{_label(name)}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(record: RunRecord, directory: str, name: str) -> str:
+    '''
+    write the record to <directory>/talklib_<name>.prom, one file per show so shows
+    running side by side don't overwrite each other. The file is replaced in one go,
+    so the collector never reads half of it. Returns the path.
+    '''
+    path = os.path.join(directory, f'talklib_{name}.prom')
+    with atomic_write(path, prefix=f'.talklib_{name}.') as file:
+        file.write(to_prometheus(record))
+    return path
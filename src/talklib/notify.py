@@ -1,12 +1,26 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
 from email.message import EmailMessage
 from enum import Enum
 import logging
-from logging.handlers import SysLogHandler
-import smtplib
-
-from twilio.rest import Client
+from logging.handlers import QueueHandler, QueueListener, SysLogHandler
+import queue
+import re
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
 from talklib.ev import EV
+from talklib.registry import discard, per_process
+
+if TYPE_CHECKING:
+    import smtplib
+    from twilio.rest import Client
+
+# smtplib and (especially) twilio are slow to import, and plenty of scripts never send
+# an email or SMS, so they are only imported the first time we actually need them.
 
 class LogLevel(Enum):
     INFO = logging.INFO
@@ -15,26 +29,428 @@ class LogLevel(Enum):
     ERROR = logging.ERROR
     CRITICAL = logging.CRITICAL
 
+class _BatchingSysLogHandler(SysLogHandler):
+    '''
+    A SysLogHandler that keeps one socket for the life of the process.
+    It connects lazily (so an unreachable TCP server never raises in the caller),
+    reconnects after a failure, and sends a batch of TCP messages in a single write.
+    '''
+    def __init__(self, address: tuple, socktype: int):
+        logging.Handler.__init__(self)
+        self.address = address
+        self.facility = SysLogHandler.LOG_USER
+        self.socktype = socktype
+        self.unixsocket = False
+        self.socket = None
+        self.udp_address: tuple = None  # self.address, resolved
+
+    def __encode(self, record: logging.LogRecord) -> bytes:
+        '''same wire format as SysLogHandler.emit'''
+        message = self.ident + self.format(record)
+        if self.append_nul:
+            message += '\000'
+        priority = self.encodePriority(self.facility, self.mapPriority(record.levelname))
+        return f'<{priority}>'.encode('utf-8') + message.encode('utf-8')
+
+    def __connect(self) -> None:
+        if self.socktype == socket.SOCK_STREAM:
+            self.socket = socket.create_connection(self.address, timeout=5)
+            return
+        # like SysLogHandler: whatever family the host resolves to, so IPv6 servers work too
+        host, port = self.address
+        error = OSError(f'Unable to resolve {host}')
+        for family, socktype, proto, _, address in socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM):
+            try:
+                self.socket = socket.socket(family, socktype, proto)
+            except OSError as failed:
+                error = failed
+                continue
+            self.udp_address = address
+            return
+        raise error
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.emit_batch([record])
+
+    def emit_batch(self, records: list) -> None:
+        try:
+            if not self.socket:
+                self.__connect()
+            messages = [self.__encode(record) for record in records]
+            if self.socktype == socket.SOCK_STREAM:
+                self.socket.sendall(b''.join(messages))
+            else:
+                for message in messages:
+                    self.socket.sendto(message, self.udp_address)
+        except Exception:
+            self.close_socket()  # start over with a fresh connection next time
+            self.handleError(records[0])
+
+    def close_socket(self) -> None:
+        if self.socket:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+
+    def close(self) -> None:
+        self.close_socket()
+        logging.Handler.close(self)
+
+class _DroppingQueueHandler(QueueHandler):
+    '''if the queue is full, drop the message and count it instead of waiting'''
+    def __init__(self, queue: queue.Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+class _BatchingQueueListener(QueueListener):
+    '''hands the handler everything that has piled up in the queue (up to batch_size messages) in one go'''
+    def __init__(self, queue: queue.Queue, handler: _BatchingSysLogHandler, batch_size: int):
+        super().__init__(queue, handler)
+        self.batch_size = batch_size
+        self.__stopping = False
+
+    def dequeue(self, block: bool):
+        if self.__stopping:
+            return self._sentinel
+        record = self.queue.get(block)
+        if record is self._sentinel:
+            return record
+        batch = [record]
+        while len(batch) < self.batch_size:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is self._sentinel:
+                self.__stopping = True  # send what we have, then stop
+                break
+            batch.append(record)
+        return batch
+
+    def handle(self, batch: list) -> None:
+        for handler in self.handlers:
+            handler.emit_batch([self.prepare(record) for record in batch])
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)  # wait for room rather than raising if the queue is full
+
+class _SyslogPipeline:
+    '''
+    One long-lived syslog connection per server/port/protocol, per process.
+    Callers put messages on a bounded queue and return immediately;
+    a background thread sends them.
+    '''
+    def __init__(self, host: str, port: int, protocol: str, queue_size: int, batch_size: int):
+        socktype = socket.SOCK_STREAM if protocol == 'tcp' else socket.SOCK_DGRAM
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queue_handler = _DroppingQueueHandler(self.queue)
+        self.handler = _BatchingSysLogHandler(address=(host, port), socktype=socktype)
+        self.listener = _BatchingQueueListener(queue=self.queue, handler=self.handler, batch_size=batch_size)
+        self.logger = logging.getLogger(f'talklib.syslog.{protocol}.{host}.{port}')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.handlers = [self.queue_handler]
+        self.listener.start()
+
+    def stop(self) -> None:
+        '''send anything still queued, then close the connection'''
+        self.listener.stop()
+        self.handler.close()
+
+def _get_pipeline(host: str, port: int, protocol: str, queue_size: int, batch_size: int) -> _SyslogPipeline:
+    make = lambda: _SyslogPipeline(host=host, port=port, protocol=protocol, queue_size=queue_size, batch_size=batch_size)
+    return per_process(key=('syslog', host, port, protocol), factory=make, close=_SyslogPipeline.stop)
+
 class Syslog:
     def __init__ (self):
         self.syslog_host = EV().syslog_host
         self.syslog_port = 514
+        self.syslog_protocol = 'udp'  # or 'tcp'
+        self.queue_size = 1000  # messages waiting to be sent. Beyond this, new messages are dropped (and counted)
+        self.batch_size = 50  # most messages sent at once
 
     def send_syslog_message(self, message: str, level: str = 'info'):
         '''
         Send message to Syslog server.
         Levels: info (default), debug, warning, error, critical.
 
-        The level type and the my_logger.method() function must match!
+        The message is queued and sent in the background, so this returns immediately.
         '''
-        handler = SysLogHandler(address=(self.syslog_host, self.syslog_port))
+        level = LogLevel[level.upper()].value
+        self.__get_pipeline().logger.log(level=level, msg=message)
+
+    def __get_pipeline(self) -> _SyslogPipeline:
+        if self.syslog_protocol.lower() not in ('udp', 'tcp'):
+            raise ValueError(f"Sorry, syslog_protocol must be 'udp' or 'tcp', but you used '{self.syslog_protocol}'.")
+        return _get_pipeline(host=self.syslog_host, port=self.syslog_port, protocol=self.syslog_protocol.lower(),
+                             queue_size=self.queue_size, batch_size=self.batch_size)
+
+    @property
+    def dropped(self) -> int:
+        '''how many messages were dropped because the queue was full'''
+        return self.__get_pipeline().queue_handler.dropped
+
+    def flush(self) -> None:
+        '''wait until everything queued so far has been sent. Mostly useful in tests.'''
+        discard(key=('syslog', self.syslog_host, self.syslog_port, self.syslog_protocol.lower()))
+
+class _SMTPSession:
+    '''
+    One SMTP connection per mail server, shared by every Notify in the process,
+    so we only pay for the connection and handshake once.
+
+    If the connection has been idle for a while we check it with NOOP before using it,
+    and if it has gone away we reconnect (and retry the send once). We only retry if the
+    connection dropped before the message itself went out; after that the server may
+    already have it, and a resend could deliver it twice.
+    '''
+    def __init__(self, host: str, timeout: int | float, noop_after: int | float = 10):
+        self.host = host
+        self.timeout = timeout  # seconds allowed for connecting and for each command
+        self.noop_after = noop_after  # seconds idle before we check the connection is still alive
+        self.lock = threading.Lock()
+        self.connection: 'smtplib.SMTP' = None
+        self.last_used = 0.0
+
+    def __connect(self) -> None:
+        import smtplib
+        self.close()
+
+        class Connection(smtplib.SMTP):
+            '''notes when the message has been handed to the server'''
+            handed_off = False
+
+            def data(self, msg):
+                self.handed_off = True
+                return super().data(msg)
+
+        self.connection = Connection(host=self.host, timeout=self.timeout)
+
+    def __drop(self) -> None:
+        '''close without QUIT; after an error we don't know what state the server is in'''
+        self.connection.close()
+        self.connection = None
+
+    def __is_alive(self) -> bool:
+        if self.connection is None:
+            return False
+        if time.monotonic() - self.last_used < self.noop_after:
+            return True
+        import smtplib
+        try:
+            return self.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, message: EmailMessage) -> None:
+        import smtplib
+        with self.lock:
+            if not self.__is_alive():
+                self.__connect()
+            self.connection.handed_off = False
+            try:
+                self.connection.send_message(message)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if self.connection.handed_off:
+                    self.__drop()
+                    raise
+                # the server dropped us since the last check, before it saw the message. one fresh attempt.
+                self.__connect()
+                try:
+                    self.connection.send_message(message)
+                except (smtplib.SMTPException, OSError):
+                    self.__drop()
+                    raise
+            except (smtplib.SMTPException, OSError):
+                self.__drop()
+                raise
+            self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        import smtplib
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+    def stop(self) -> None:
+        '''close, after any send in progress'''
+        with self.lock:
+            self.close()
+
+def _get_smtp_session(host: str, timeout: int | float) -> _SMTPSession:
+    session = per_process(key=('smtp', host), factory=lambda: _SMTPSession(host=host, timeout=timeout), close=_SMTPSession.stop)
+    session.timeout = timeout
+    return session
+
+def _make_twilio_http_client(timeout: int | float, api_url: str = None):
+    '''Twilio's HTTP client, or one that sends every request to api_url instead of Twilio's servers (E.G. a local stand-in for testing)'''
+    from twilio.http.http_client import TwilioHttpClient
+
+    class RedirectedHttpClient(TwilioHttpClient):
+        def request(self, method, url, *args, **kwargs):
+            parsed = urlparse(url)
+            url = f'{api_url.rstrip("/")}{parsed.path}' + (f'?{parsed.query}' if parsed.query else '')
+            return super().request(method, url, *args, **kwargs)
+
+    return RedirectedHttpClient(timeout=timeout) if api_url else TwilioHttpClient(timeout=timeout)
+
+def _get_twilio_client(sid: str, token: str, timeout: int | float, api_url: str = None) -> 'Client':
+    '''one client (and so one pool of connections to Twilio) per set of credentials, per process'''
+    from twilio.rest import Client
+    make = lambda: Client(sid, token, http_client=_make_twilio_http_client(timeout=timeout, api_url=api_url))
+    return per_process(key=('twilio', sid, token, timeout, api_url), factory=make)
 
-        my_logger = logging.getLogger('MyLogger')
-        my_logger.setLevel(LogLevel[level.upper()].value)
-        my_logger.addHandler(handler)
+def _get_twilio_executor() -> ThreadPoolExecutor:
+    '''
+    the background worker(s) SMS and calls are sent from.
+    Python waits for anything still being sent before it exits.
+    '''
+    make = lambda: ThreadPoolExecutor(max_workers=2, thread_name_prefix='talklib-twilio')
+    return per_process(key=('twilio executor',), factory=make, close=ThreadPoolExecutor.shutdown)
 
-        my_logger.log(level=LogLevel[level.upper()].value, msg=message)
-        my_logger.removeHandler(handler) # don't forget this after you send the message!
+class _CircuitBreaker:
+    '''
+    Stop trying a channel that keeps failing. After `threshold` failures in a row the
+    channel is skipped for `reset_after` seconds, then one attempt is let through: if
+    it works the channel is back in use, if not it is skipped for another `reset_after`.
+    '''
+    def __init__(self, threshold: int, reset_after: int | float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: float = None
+        self.__lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.__lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                self.opened_at = time.monotonic()  # one trial attempt, then wait again unless it works
+                return True
+            return False
+
+    def record(self, succeeded: bool) -> None:
+        with self.__lock:
+            if succeeded:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures = self.failures + 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+def _get_breaker(channel: str, threshold: int, reset_after: int | float) -> _CircuitBreaker:
+    '''one breaker per channel per process, shared by every show'''
+    make = lambda: _CircuitBreaker(threshold=threshold, reset_after=reset_after)
+    breaker = per_process(key=('breaker', channel), factory=make)
+    breaker.threshold, breaker.reset_after = threshold, reset_after
+    return breaker
+
+def _get_notify_executor(channel: str) -> ThreadPoolExecutor:
+    '''
+    the worker threads a channel is sent from. Each channel has its own, so the channels all go out
+    at once, and a channel that hangs only ties up its own workers, never another channel's.
+    '''
+    make = lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix=f'talklib-notify-{channel}')
+    return per_process(key=('notify executor', channel), factory=make, close=ThreadPoolExecutor.shutdown)
+
+def _send_and_wait(send) -> None:
+    '''call send, and if it hands back a Future (E.G. Twilio in the background), wait on that too'''
+    result = send()
+    if isinstance(result, Future):
+        result.result()
+
+def _cause_of(message: str) -> str:
+    '''what an alert is about, ignoring details like times and sizes that differ from one repeat to the next'''
+    return ' '.join(re.sub(r'\d+', '#', message.lower()).split())
+
+def _make_digest(held: list, window: int | float) -> str:
+    repeats = list(dict.fromkeys(held))  # without duplicates, in the order they came in
+    return f'{len(held)} more alert(s) like this in the last {window} seconds:\n' + '\n'.join(repeats)
+
+def _digest_subject(held: list, senders: list) -> str:
+    '''
+    the digest covers several shows, so it can't go out under any one show's subject.
+    senders are the subjects of every alert in the window (the first one included); one per show.
+    '''
+    return f'Digest: {len(held)} more alert(s) about the same problem, from {len(set(senders))} show(s)'
+
+class _Coalescer:
+    '''
+    Collapse repeats of the same alert. The first alert for a cause is sent right away;
+    any more with the same cause within `window` seconds are held back, then sent as
+    one digest when the window ends.
+    '''
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__windows = {}  # key: (timer, held messages, who sent each alert, function to send the digest)
+        self.sent = 0  # alerts let through
+        self.suppressed = 0  # alerts held back for a digest
+
+    def submit(self, key: tuple, message: str, window: int | float, send_digest, sender: str = None) -> bool:
+        '''
+        returns True if the alert should be sent now. send_digest is called with the held
+        messages and the sender of every alert in the window (E.G. the email subject).
+        '''
+        with self.__lock:
+            if key in self.__windows:
+                self.__windows[key][1].append(message)
+                self.__windows[key][2].append(sender)
+                self.suppressed = self.suppressed + 1
+                return False
+            timer = threading.Timer(window, self.__close, args=(key,))
+            timer.daemon = True
+            self.__windows[key] = (timer, [], [sender], send_digest)
+            self.sent = self.sent + 1
+        timer.start()
+        return True
+
+    def __close(self, key: tuple) -> None:
+        with self.__lock:
+            timer, held, senders, send_digest = self.__windows.pop(key, (None, [], [], None))
+        if not held:
+            return
+        try:
+            send_digest(held, senders)
+        except Exception as error:
+            print(f'Unable to send digest of {len(held)} alert(s): {error}')
+
+    def flush(self) -> None:
+        '''send any digests now instead of waiting for their windows to end'''
+        with self.__lock:
+            windows = list(self.__windows.items())
+        for key, (timer, _, _, _) in windows:
+            timer.cancel()
+            self.__close(key)
+
+def _get_coalescer() -> _Coalescer:
+    '''one per process, so alerts from every show are coalesced together. Pending digests are sent when it exits'''
+    return per_process(key=('coalescer',), factory=_Coalescer, close=_Coalescer.flush)
+
+@dataclass
+class ChannelResult:
+    '''the outcome of sending a notification over one channel (sms, mail, syslog)'''
+    channel: str
+    seconds: float = 0
+    skipped: bool = False  # the channel has been failing, so we didn't try it
+    error: Exception = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and not self.skipped
 
 class Notify:
     def __init__ (self,
@@ -50,6 +466,14 @@ class Notify:
         self.email_enable = email_enable
         self.syslog = Syslog()
         self.EV = EV()
+        self.smtp_timeout = 30  # seconds to wait on the mail server
+        self.twilio_timeout = 15  # seconds to wait on Twilio
+        self.twilio_background = True  # send SMS/calls from a background thread instead of waiting for Twilio
+        self.twilio_api_url: str = None  # send Twilio requests here instead of api.twilio.com. for testing
+        self.channel_deadlines = {'sms': 20, 'mail': 15, 'syslog': 5}  # seconds send_all waits on each channel
+        self.breaker_threshold = 3  # failures in a row before a channel is skipped
+        self.breaker_reset = 300  # seconds a failing channel is skipped for
+        self.coalesce_window = 0  # seconds. repeats of an SMS/email within this window are sent as one digest. 0 sends every one
 
     def send_syslog(self, message: str, level: str) -> None:
         '''send message to syslog server'''
@@ -57,41 +481,134 @@ class Notify:
             return
         self.syslog.send_syslog_message(message=message, level=level)
     
-    def send_call(self, message: str) -> None:
-        '''send voice call via twilio'''
+    def send_call(self, message: str) -> Future | str | None:
+        '''
+        send voice call via twilio.
+        In the background (the default), returns a Future right away; otherwise returns the call's sid.
+        '''
         if not (self.twilio_enable and self.enable_all):
             return
-        client = Client(self.EV.twilio_sid, self.EV.twilio_token)
+        return self.__dispatch_twilio(self.__create_call, message)
 
-        call = client.calls.create(
+    def send_sms(self, message: str, cause: str = None) -> Future | str | None:
+        '''
+        send sms via twilio.
+        In the background (the default), returns a Future right away; otherwise returns the message's sid.
+        Returns None if it's a repeat held back for a digest (see coalesce_window).
+        '''
+        if not (self.twilio_enable and self.enable_all):
+            return
+        send_digest = lambda held, senders: self.__create_sms(_make_digest(held, self.coalesce_window))
+        if not self.__coalesce(channel='sms', message=message, cause=cause, send_digest=send_digest):
+            return
+        return self.__dispatch_twilio(self.__create_sms, message)
+
+    def __get_twilio_client(self) -> 'Client':
+        return _get_twilio_client(sid=self.EV.twilio_sid, token=self.EV.twilio_token,
+                                  timeout=self.twilio_timeout, api_url=self.twilio_api_url)
+
+    def __create_call(self, message: str) -> str:
+        call = self.__get_twilio_client().calls.create(
                                 twiml=f'<Response><Say>{message}</Say></Response>',
                                 to=self.EV.twilio_to,
                                 from_=self.EV.twilio_from
                             )
-        call.sid
+        return call.sid
 
-    def send_sms(self, message: str) -> None:
-        '''send sms via twilio. '''
-        if not (self.twilio_enable and self.enable_all):
-            return
-        client = Client(self.EV.twilio_sid, self.EV.twilio_token)
-        SMS = client.messages.create(
+    def __create_sms(self, message: str) -> str:
+        SMS = self.__get_twilio_client().messages.create(
             body=message,
             from_=self.EV.twilio_from,
             to=self.EV.twilio_to
         )
-        SMS.sid
+        return SMS.sid
+
+    def __dispatch_twilio(self, send, message: str) -> Future | str:
+        if not self.twilio_background:
+            return send(message)
+        future = _get_twilio_executor().submit(send, message)
+        future.add_done_callback(self.__report_twilio_failure)
+        return future
 
-    def send_mail(self, message: str, subject: str) -> None:
+    def __report_twilio_failure(self, future: Future) -> None:
+        '''nobody is waiting on a background send, so make sure a failure is at least logged'''
+        error = future.exception()
+        if error is not None:
+            self.send_syslog(message=f'Unable to send Twilio notification: {error}', level='error')
+
+    def send_mail(self, message: str, subject: str, cause: str = None) -> None:
         '''send email to TL gmail account via relay address'''
         if not (self.email_enable and self.enable_all):
             return
+        send_digest = lambda held, senders: self.__send_mail_now(_make_digest(held, self.coalesce_window),
+                                                                 _digest_subject(held, senders))
+        if not self.__coalesce(channel='mail', message=message, cause=cause, send_digest=send_digest, sender=subject):
+            return
+        self.__send_mail_now(message=message, subject=subject)
+
+    def __send_mail_now(self, message: str, subject: str) -> None:
         format = EmailMessage()
         format.set_content(message)
         format['Subject'] = subject
         format['From'] = self.EV.fromEmail
         format['To'] = self.EV.toEmail
 
-        mail = smtplib.SMTP(host=self.EV.mail_server)
-        mail.send_message(format)
-        mail.quit()
\ No newline at end of file
+        _get_smtp_session(host=self.EV.mail_server, timeout=self.smtp_timeout).send(format)
+
+    def __coalesce(self, channel: str, message: str, cause: str, send_digest, sender: str = None) -> bool:
+        '''True if the alert should be sent now, False if it's a repeat held back for a digest'''
+        if not self.coalesce_window:
+            return True
+        key = (channel, _cause_of(cause or message))
+        return _get_coalescer().submit(key=key, message=message, window=self.coalesce_window,
+                                       send_digest=send_digest, sender=sender)
+
+    def flush_digests(self) -> None:
+        '''send any pending digests now (they are also sent when Python exits)'''
+        _get_coalescer().flush()
+
+    def send_all(self, sends: dict) -> list:
+        '''
+        Send over several channels at once. sends maps a channel name ('sms', 'mail', 'syslog')
+        to a function that sends over it. Waits at most channel_deadlines[channel] seconds for each,
+        so a slow or dead channel can't hold up the rest (or the show). A send that hasn't started by
+        its deadline is cancelled. A channel that has failed breaker_threshold times in a row
+        is skipped for breaker_reset seconds; sends that were cancelled don't count.
+        Returns a ChannelResult per channel, in the same order, and never raises.
+        '''
+        start = time.monotonic()
+        pending = []
+        results = []
+        for channel, send in sends.items():
+            result = ChannelResult(channel=channel)
+            results.append(result)
+            breaker = _get_breaker(channel=channel, threshold=self.breaker_threshold, reset_after=self.breaker_reset)
+            if not breaker.allow():
+                result.skipped = True
+                continue
+            pending.append((result, breaker, _get_notify_executor(channel).submit(_send_and_wait, send)))
+
+        for result, breaker, future in sorted(pending, key=lambda item: self.__get_deadline(item[0].channel)):
+            remaining = self.__get_deadline(result.channel) - (time.monotonic() - start)
+            ran = True
+            try:
+                future.result(timeout=max(0, remaining))
+            except FutureTimeoutError as error:  # not the builtin TimeoutError before Python 3.11
+                if future.done():
+                    result.error = error  # the channel itself timed out (E.G. a socket timeout)
+                elif future.cancel():
+                    # still waiting behind other sends on this channel. It never ran, so it says nothing
+                    # about whether the channel works, and it's too late to send it now.
+                    result.error = TimeoutError(f'{result.channel} did not start within {self.__get_deadline(result.channel)} seconds')
+                    ran = False
+                else:
+                    result.error = TimeoutError(f'{result.channel} did not finish within {self.__get_deadline(result.channel)} seconds')
+            except Exception as error:
+                result.error = error
+            result.seconds = time.monotonic() - start
+            if ran:
+                breaker.record(succeeded=result.error is None)
+        return results
+
+    def __get_deadline(self, channel: str) -> int | float:
+        return self.channel_deadlines.get(channel, 15)
@@ -0,0 +1,91 @@
+'''
+Check many RSS feeds at once.
+
+Checking whether a feed has been updated is almost all waiting on the network,
+so instead of checking each show's feed one after another we check them all
+concurrently with asyncio. The whole check takes about as long as the slowest feed.
+'''
+
+import asyncio
+from dataclasses import dataclass
+
+import aiohttp
+
+from talklib.feed import Episode, FirstItemParser
+from talklib.show import TLShow
+
+
+@dataclass
+class FeedStatus:
+    '''the result of checking one show's feed'''
+    show: TLShow
+    ready: bool
+    episode: Episode = None
+    error: Exception = None
+
+
+class FeedPoller:
+    '''
+    Check the feeds of a list of RSS shows concurrently.
+
+    Permalink and local shows have no feed to check, so they are always ready.
+    Like TLShow, a feed that isn't updated is checked again (attempts times,
+    retry_delay seconds apart), but waiting on one feed never holds up the others.
+
+    A ready show is handed the episode we found (TLShow.polled_episode),
+    so running it afterwards doesn't fetch the feed a second time.
+    '''
+    def __init__(self,
+                 shows: list = None,
+                 limit_per_host: int = 4,
+                 timeout: int | float = 30,
+                 attempts: int = 3,
+                 retry_delay: int | float = 1,
+                 ):
+
+        self.shows: list = shows if shows is not None else []
+        self.limit_per_host = limit_per_host  # how many connections to open to the same server at once
+        self.timeout = timeout  # seconds allowed for each request
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+
+    async def __get_episode(self, session: aiohttp.ClientSession, url: str) -> Episode:
+        '''fetch just enough of the feed to read its newest item'''
+        header = {'User-Agent': 'Darth Vader'}  # usually helpful to identify yourself
+        async with session.get(url, headers=header) as response:
+            parser = FirstItemParser()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                if parser.feed(chunk):
+                    return Episode.from_feed(parser.root)
+            return Episode.from_feed(parser.close())
+
+    async def __check_show(self, session: aiohttp.ClientSession, show: TLShow) -> FeedStatus:
+        if show.is_permalink or show.is_local or not show.url:
+            return FeedStatus(show=show, ready=True)
+        episode = None
+        try:
+            for attempt in range(self.attempts):
+                if attempt:
+                    await asyncio.sleep(self.retry_delay)
+                episode = await self.__get_episode(session=session, url=show.url)
+                if episode.is_from_today():
+                    show.polled_episode = episode
+                    return FeedStatus(show=show, ready=True, episode=episode)
+            return FeedStatus(show=show, ready=False, episode=episode)
+        except Exception as error:
+            return FeedStatus(show=show, ready=False, episode=episode, error=error)
+
+    async def check_async(self) -> list:
+        '''check every show's feed and return a list of FeedStatus, in the same order as self.shows'''
+        connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            return await asyncio.gather(*[self.__check_show(session=session, show=show) for show in self.shows])
+
+    def check(self) -> list:
+        '''same as check_async, for calling from regular (non-async) code'''
+        return asyncio.run(self.check_async())
+
+    def ready(self) -> list:
+        '''the shows that are ready to be processed'''
+        return [status.show for status in self.check() if status.ready]
@@ -0,0 +1,115 @@
+'''
+Profiling a show's run, for when a show suddenly takes twice as long or runs the PC out of memory.
+
+Each stage of the run (see talklib.metrics) gets its own cProfile, saved as a .pstats file
+(open it with `python -m pstats <file>` or a viewer like snakeviz), and its own report of
+where memory was allocated, from tracemalloc.
+
+This is only imported when profiling is turned on (TLShow.profile_dir or the
+talklib_profile_dir environment variable), so it costs nothing otherwise.
+
+Notes:
+- cProfile only sees the thread the show runs on. Work handed to other threads (E.G. copying
+  to several destinations at once) shows up as time spent waiting on them.
+- Only one cProfile can run at a time on newer Pythons, and tracemalloc sees every thread.
+  So profile one show at a time. TLShowBatch turns profiling off when its shows share a process.
+- Profiling never fails a show. If something goes wrong, it's reported (see `log`) and that stage
+  (or the whole run, if the folder can't be made) just isn't profiled.
+'''
+
+import cProfile
+from datetime import datetime
+import os
+import threading
+import tracemalloc
+
+# tracemalloc is one switch for the whole process. Count the profilers using it, so one
+# finishing doesn't turn it off under another, and leave it alone if someone else started it.
+_tracemalloc_users = 0
+_tracemalloc_ours = False
+_tracemalloc_lock = threading.Lock()
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_ours
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_ours = True
+        _tracemalloc_users = _tracemalloc_users + 1
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_ours
+    with _tracemalloc_lock:
+        _tracemalloc_users = max(0, _tracemalloc_users - 1)
+        if _tracemalloc_users == 0 and _tracemalloc_ours:
+            tracemalloc.stop()
+            _tracemalloc_ours = False
+
+
+class StageProfiler:
+    '''profile one stage at a time, writing the results to directory. Problems are passed to log, never raised'''
+    def __init__(self, directory: str, name: str, top: int = 25, log=print):
+        self.directory = directory
+        self.prefix = f'{name}-{datetime.now().strftime("%Y%m%d-%H%M%S")}'
+        self.top = top  # how many allocation sites to list per stage
+        self.log = log
+        self.count = 0
+        self.__started = False
+
+    def start(self) -> None:
+        '''raises OSError if the folder can't be made, so the caller can carry on without profiling'''
+        os.makedirs(self.directory, exist_ok=True)
+        if not self.__started:
+            _start_tracemalloc()
+            self.__started = True
+
+    def stop(self) -> None:
+        if self.__started:
+            self.__started = False
+            _stop_tracemalloc()
+
+    def enter(self, stage: str) -> tuple | None:
+        '''start profiling a stage. Pass what this returns to exit()'''
+        self.count = self.count + 1
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            profile = None  # something else is already profiling (E.G. another show)
+        try:
+            before = None
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+                before = self.__snapshot()
+            return stage, profile, before
+        except Exception as error:
+            if profile is not None:
+                profile.disable()
+            self.log(f'Unable to profile {stage}: {error}')
+            return None
+
+    def exit(self, token: tuple | None) -> None:
+        '''stop profiling the stage and write its .pstats and memory report'''
+        if token is None:
+            return
+        stage, profile, before = token
+        if profile is not None:
+            profile.disable()
+        try:
+            path = os.path.join(self.directory, f'{self.prefix}-{self.count:02d}-{stage}')
+            if profile is not None:
+                profile.dump_stats(f'{path}.pstats')
+            if before is not None and tracemalloc.is_tracing():
+                after = self.__snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                lines = [f'{stage}: peak {peak / 1024:.0f} KB traced, {current / 1024:.0f} KB still allocated at the end.',
+                         f'Top {self.top} places memory was allocated during the stage:']
+                lines.extend(str(difference) for difference in after.compare_to(before, 'lineno')[:self.top])
+                with open(f'{path}-memory.txt', mode='w', encoding='utf-8') as file:
+                    file.write('\n'.join(lines) + '\n')
+        except Exception as error:
+            self.log(f'Unable to save the profile for {stage}: {error}')
+
+    def __snapshot(self) -> tracemalloc.Snapshot:
+        '''what's allocated right now, leaving out tracemalloc's own bookkeeping'''
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
@@ -0,0 +1,46 @@
+'''
+Objects shared by everything in one process: connections, worker threads, counters.
+
+A child process (E.G. TLShowBatch with use_processes) inherits a copy of its parent's
+objects but not the threads or sockets behind them, so each process builds its own.
+Anything stored with a close function is closed when the process exits.
+'''
+
+import atexit
+import os
+import threading
+
+_objects = {}  # (key, pid): (object, close)
+_lock = threading.RLock()  # a factory may itself ask for something shared
+
+
+def per_process(key: tuple, factory, close=None):
+    '''the object stored under key in this process. factory() makes it the first time it's asked for'''
+    with _lock:
+        entry = _objects.get((key, os.getpid()))
+        if entry is None:
+            entry = _objects[(key, os.getpid())] = (factory(), close)
+        return entry[0]
+
+
+def discard(key: tuple) -> None:
+    '''close (if it has a close function) and forget the object stored under key, so the next one asked for is new'''
+    with _lock:
+        value, close = _objects.pop((key, os.getpid()), (None, None))
+    if close is not None:
+        close(value)
+
+
+@atexit.register
+def close_all() -> None:
+    '''
+    close everything this process stored, most recent first. Closing one object can make
+    another (E.G. a digest sent on the way out opens a mail connection), so keep going until there's nothing left.
+    '''
+    while True:
+        with _lock:
+            keys = [key for key, pid in _objects if pid == os.getpid()]
+        if not keys:
+            return
+        for key in reversed(keys):
+            discard(key)
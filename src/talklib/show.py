@@ -1,16 +1,37 @@
+from dataclasses import dataclass, field
 from datetime import datetime
 import glob
 import os
-import shutil
 import time
 import xml.etree.ElementTree as ET
 
 import requests
 
+from talklib.cache import JSONCache
+from talklib.errors import (ShowError, InvalidAttributeError, FeedError, FeedNotUpdatedError,
+                            DownloadError, ConversionError, TransferError, SourceFileNotFoundError)
 from talklib.ev import EV
+from talklib.feed import Episode, parse_first_item
+from talklib.metrics import RunRecord, RunRecorder, append_jsonl, write_textfile
 from talklib.notify import Notify
 from talklib.utils import get_timestamp, clear_screen, raise_exception_and_wait, today_is_weekday
-from talklib.ffmpeg import FFMPEG
+from talklib.ffmpeg import FFMPEG, ConversionAnalysis
+from talklib.transfer import copy_to_destinations
+from talklib.wav import AudioStats, analyze, read_header
+
+
+@dataclass
+class RunResult:
+    '''what TLShow.run() did, when it succeeded'''
+    show: str
+    output_file: str
+    seconds: float
+    episode: Episode = None  # RSS shows only
+    transfers: list = field(default_factory=list)  # a TransferResult for each destination
+    record: RunRecord = None  # how long each stage took (see talklib.metrics)
+    audio: AudioStats = None  # levels, clipping and silence, if analyze_audio is on
+    conversion: ConversionAnalysis = None  # length, loudness and silence measured while converting, if ffmpeg.analyze is on
+    unchanged: bool = False  # skip_unchanged found we'd already delivered this episode, so nothing was done
 
 
 class TLShow():
@@ -30,7 +51,29 @@ class TLShow():
         self.check_if_below: int | float = 0
         self.notifications = Notify()
         self.ffmpeg = FFMPEG()
-        self.destinations: list = EV().destinations
+        self.destinations: list = list(EV().destinations)
+        self.download_chunk_size: int = 1024 * 1024  # bytes held in memory at once while downloading
+        self.download_timeout: tuple = (10, 60)  # seconds to wait for (connecting, each read)
+        self.use_feed_cache: bool = True
+        self.cache_dir: str = EV().cache_dir
+        self.stream_convert: bool = False  # feed downloads straight into ffmpeg instead of saving them first
+        self.copy_workers: int = 4  # how many destinations to copy to at the same time
+        self.analyze_audio: bool = False  # measure peak/RMS level, clipping and silence of the converted file. needs NumPy
+        self.headless: bool = False  # no screen clearing, countdown or 'press enter'. For scheduled/unattended runs
+        self.skip_unchanged: bool = False  # do nothing if the episode is the same one we last delivered
+        self.__identity: dict = None  # what the episode we're delivering looks like, for skip_unchanged
+        self.__unchanged: bool = False
+        self.__episode: Episode = None  # the newest item in the feed, fetched once per run
+        self.polled_episode: Episode = None  # the newest item, if FeedPoller already fetched it. the next run uses it instead of fetching the feed
+        self.__transfers: list = []  # TransferResult for each destination, from the copy step
+        self.__audio: AudioStats = None  # from analyze_audio
+        self.run_hooks: list = []  # functions to call with the RunRecord after every run, whether it worked or not
+        self.metrics_syslog: bool = False  # send the RunRecord to syslog (as JSON) after every run
+        self.metrics_jsonl: str = None  # path of a JSON lines file to add each RunRecord to
+        self.metrics_textfile_dir: str = None  # folder to write a Prometheus textfile to after every run
+        self.last_run: RunRecord = None
+        self.profile_dir: str = EV().profile_dir  # save a cProfile and memory report for each stage here. off if not set
+        self.__recorder = RunRecorder(show=None)
     
     
     def __str__(self) -> str:
@@ -54,27 +97,64 @@ class TLShow():
         ffmpeg = self.ffmpeg
         ffmpeg.input_file = input
         ffmpeg.output_file = self.__create_output_filename()
+        if (ffmpeg.two_pass or ffmpeg.output_cache) and ffmpeg.cache_dir is None:
+            ffmpeg.cache_dir = self.cache_dir
         self.__prep_syslog(message='preparing to convert')
         ffmpeg_commands = ffmpeg.get_commands()
         self.__prep_syslog(message=f'FFmpeg commands: {ffmpeg_commands}')
-        try:
-            file = ffmpeg.convert()
-            self.__prep_syslog(message='file converted successfully')
-            return file
-        except Exception as ffmpeg_exception:
-            self.__send_notifications(message=f'FFmpeg error: {ffmpeg_exception}', subject='Error')
-            raise_exception_and_wait(ffmpeg_exception)
+        with self.__recorder.stage('convert'):
+            try:
+                file = ffmpeg.convert()
+                self.__prep_syslog(message='file converted successfully')
+                if ffmpeg.output_cache:
+                    self.__log_output_cache()
+                if ffmpeg.two_pass and not ffmpeg.output_cached:
+                    self.__log_loudness_measurement()
+                self.__recorder.add_bytes(os.path.getsize(file))
+                return file
+            except Exception as ffmpeg_exception:
+                self.__send_notifications(message=f'FFmpeg error: {ffmpeg_exception}', subject='Error')
+                self.__stop(message=str(ffmpeg_exception), error=ConversionError)
+
+
+    def __log_output_cache(self):
+        cache = self.ffmpeg.get_output_cache()
+        if cache is None:
+            return
+        found = 'Used the converted file from the cache' if self.ffmpeg.output_cached else 'Converted file was not in the cache'
+        self.__prep_syslog(message=f'{found} ({cache.hits} hit(s), {cache.misses} miss(es), {cache.evictions} eviction(s) so far)')
 
+    def __log_loudness_measurement(self):
+        measurement = self.ffmpeg.measurement
+        if not measurement:
+            self.__prep_syslog(message='Unable to measure the loudness for two-pass normalization. Used one pass instead.', level='warning')
+            return
+        source = 'from the cache' if self.ffmpeg.measurement_cached else 'measured'
+        self.__prep_syslog(message=f'Two-pass normalization: input loudness {measurement["input_i"]} LUFS ({source})')
 
     def __copy_then_remove(self, fileToCopy):
-        '''TODO explain'''
-        
-        for destination in self.destinations:
-            self.__prep_syslog(message=f'Copying {fileToCopy} to {destination}...')
-            shutil.copy(fileToCopy, destination)
+        '''
+        copy the converted file to every destination at once, then remove our local copy.
+        If any copy fails we keep the local file so it can be copied manually;
+        __check_file_transferred will send the notification.
+        '''
+        self.__prep_syslog(message=f'Copying {fileToCopy} to {", ".join(self.destinations)}...')
+        results = copy_to_destinations(source=fileToCopy, destinations=self.destinations, max_workers=self.copy_workers)
+        self.__transfers = results
+        self.__recorder.add_bytes(sum(result.bytes for result in results if result.succeeded))
+
+        failed = False
+        for result in results:
+            if result.succeeded:
+                self.__prep_syslog(message=f'Copied {fileToCopy} to {result.destination}: {result.bytes} bytes \
+in {result.seconds:.2f} seconds ({result.bytes / 1024 / max(result.seconds, 0.001):.0f} KB/s). sha256 {result.digest}')
+            else:
+                failed = True
+                self.__prep_syslog(message=f'Unable to copy {fileToCopy} to {result.destination}: {result.error}', level='error')
 
-        #this is the file we're copying, so it is the file already converted. we always want to remove this.
-        self.__remove(fileToDelete=fileToCopy, is_output_file=True)
+        #this is the file we're copying, so it is the file already converted. we always want to remove this (once it's safely copied).
+        if not failed:
+            self.__remove(fileToDelete=fileToCopy, is_output_file=True)
 
     def __decide_whether_to_remove(self) -> bool:
         '''
@@ -127,28 +207,140 @@ class TLShow():
         a user declaring URL & is_permalink with an RSS URL, which
         currently will throw an error.
         '''
-        if self.is_permalink:
-            download_URL = self.url
-        else:
-            download_URL = self.__get_RSS_audio_url()
+        download_URL = self.__get_download_URL()
 
         self.__prep_syslog(message=f'Attempting to download audio file.')
-        input_file = 'input.mp3'  # name the file we download
-        with open (input_file, mode='wb') as downloaded_file:
-            a = requests.get(download_URL)
-            downloaded_file.write(a.content)
-            downloaded_file.close()
-        
-        self.__prep_syslog(message=f'File downloaded successfully in {os.getcwd()}.')
+        input_file = f'{self.show_filename}-input.mp3'  # name the file we download. unique per show, so shows can run side by side
+        start = time.monotonic()
+        downloaded_bytes = 0
+        try:
+            with self.__open_download(download_URL) as response:
+                expected_bytes = self.__get_expected_length(response)
+                with open (input_file, mode='wb') as downloaded_file:
+                    for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                        downloaded_file.write(chunk)
+                        downloaded_bytes = downloaded_bytes + len(chunk)
+        except requests.RequestException as error:
+            self.__download_failed(fileToDelete=input_file, reason=error)
+
+        seconds = time.monotonic() - start
+        if expected_bytes is not None and downloaded_bytes != expected_bytes:
+            self.__download_failed(fileToDelete=input_file,
+                                   reason=f'the server said to expect {expected_bytes} bytes but we received {downloaded_bytes}')
+
+        self.__prep_syslog(message=f'File downloaded successfully in {os.getcwd()}. \
+{downloaded_bytes} bytes in {seconds:.2f} seconds ({downloaded_bytes / 1024 / max(seconds, 0.001):.0f} KB/s).')
+        self.__recorder.add_bytes(downloaded_bytes)
         return downloaded_file.name
 
+    def __get_download_URL(self) -> str:
+        '''permalink shows download the URL itself; for RSS shows, the URL is the feed'''
+        if self.is_permalink:
+            return self.url
+        return self.__get_RSS_audio_url()
+
+    def __download_and_convert(self) -> str:
+        '''
+        Download and convert at the same time: the download is fed straight into
+        ffmpeg as it arrives, so the source audio is never written to (or read back from) disk.
+        Returns the name of the converted file.
+        '''
+        download_URL = self.__get_download_URL()
+        ffmpeg = self.ffmpeg
+        ffmpeg.output_file = self.__create_output_filename()
+        self.__prep_syslog(message=f'Attempting to download and convert audio file.')
+        start = time.monotonic()
+        downloaded_bytes = 0
+
+        # with a breakaway, ffmpeg stops reading once it has enough. We only notice when we
+        # try to hand it the next chunk, so keep chunks small to stop the download promptly.
+        chunk_size = min(self.download_chunk_size, 64 * 1024) if ffmpeg.breakaway else self.download_chunk_size
+
+        def count_chunks(response: requests.Response):
+            nonlocal downloaded_bytes
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                downloaded_bytes = downloaded_bytes + len(chunk)
+                yield chunk
+
+        try:
+            with self.__open_download(download_URL) as response:
+                expected_bytes = self.__get_expected_length(response)
+                output_file = ffmpeg.convert_stream(count_chunks(response))
+        except requests.RequestException as error:
+            self.__download_failed(fileToDelete=ffmpeg.output_file, reason=error)
+        except Exception as ffmpeg_exception:
+            self.__send_notifications(message=f'FFmpeg error: {ffmpeg_exception}', subject='Error')
+            self.__remove(fileToDelete=ffmpeg.output_file)
+            self.__stop(message=str(ffmpeg_exception), error=ConversionError)
+
+        seconds = time.monotonic() - start
+        if not downloaded_bytes:
+            self.__download_failed(fileToDelete=output_file, reason='the downloaded file is empty')
+        if ffmpeg.stopped_early:
+            # the rest of the file is after the breakaway, so we never downloaded it
+            skipped = f' Skipped the remaining {expected_bytes - downloaded_bytes} bytes.' if expected_bytes else ''
+            self.__prep_syslog(message=f'Stopped downloading at the breakaway ({ffmpeg.breakaway} seconds).{skipped}')
+        elif expected_bytes is not None and downloaded_bytes != expected_bytes:
+            self.__download_failed(fileToDelete=output_file,
+                                   reason=f'the server said to expect {expected_bytes} bytes but we received {downloaded_bytes}')
+
+        self.__prep_syslog(message=f'File downloaded and converted successfully. \
+{downloaded_bytes} bytes in {seconds:.2f} seconds ({downloaded_bytes / 1024 / max(seconds, 0.001):.0f} KB/s).')
+        self.__recorder.add_bytes(downloaded_bytes)
+        return output_file
+
+    def __get_output_file_from_URL(self) -> str:
+        '''get the audio for a permalink or RSS show and convert it. Returns the name of the converted file.'''
+        if self.stream_convert:
+            with self.__recorder.stage('download_convert'):
+                return self.__download_and_convert()
+        with self.__recorder.stage('download'):
+            downloaded_file = self.__download_file()
+        if self.check_downloaded_file(fileToCheck=downloaded_file, how_many_attempts=0):
+            output_file = self.__convert(input=downloaded_file)
+        self.__remove(fileToDelete=downloaded_file)
+        return output_file
+
+    def __download_failed(self, fileToDelete, reason):
+        '''notify, clean up the partial file, and stop'''
+        toSend = (
+f"There was a problem with {self.show}.\n\n\
+The download did not complete. Here is the reason: {reason}\n\n\
+Please check manually! Yesterday's file will remain.\n\n\
+{get_timestamp()}"
+)
+        self.__send_notifications(message=toSend, subject='Error')
+        self.__remove(fileToDelete=fileToDelete)
+        raise DownloadError(toSend)
+
+    def __open_download(self, download_URL: str) -> requests.Response:
+        '''
+        start a streamed download. The body is not read until the caller
+        iterates over it, so only one chunk is ever held in memory.
+        '''
+        return requests.get(download_URL, stream=True, timeout=self.download_timeout)
+
+    def __get_expected_length(self, response: requests.Response) -> int | None:
+        '''
+        the size the server told us to expect, if any.
+        requests transparently decompresses gzip/deflate bodies, so in that case
+        Content-Length doesn't match the bytes we write and we can't use it.
+        '''
+        length = response.headers.get('Content-Length')
+        if not length or response.headers.get('Content-Encoding'):
+            return None
+        try:
+            return int(length)
+        except ValueError:
+            return None
+
     def check_downloaded_file(self, fileToCheck, how_many_attempts):
         '''TODO explain'''
         try:
             filesize = os.path.getsize(fileToCheck)
         except FileNotFoundError as error:
             self.__send_notifications(message=f'It looks like the file does not exist. Here is the error: {error}', subject='Error')
-            raise FileNotFoundError
+            raise SourceFileNotFoundError(str(error))
             
         is_not_empty = False
         while how_many_attempts < 3:
@@ -169,7 +361,7 @@ It looks like the downloaded file is empty. Please check manually! Yesterday's f
 )
             self.__send_notifications(message=toSend, subject='Error')
             self.__remove(fileToDelete=fileToCheck)
-            raise Exception (toSend)
+            raise DownloadError(toSend)
             
     def __prep_syslog(self, message: str, level: str = 'info'):
         '''send message to syslog server'''
@@ -177,48 +369,67 @@ It looks like the downloaded file is empty. Please check manually! Yesterday's f
         self.notifications.send_syslog(message=message, level=level)
 
 
-    def __prep_send_mail(self, message: str, subject: str):
+    def __prep_send_mail(self, message: str, subject: str, cause: str = None):
         '''send email to TL gmail account via relay address'''
         subject = f'{subject}: {self.show}'
-        self.notifications.send_mail(subject=subject, message=message)
+        self.notifications.send_mail(subject=subject, message=message, cause=cause)
 
-    def __send_sms_if_enabled(self, message: str):
+    def __send_sms_if_enabled(self, message: str, cause: str = None):
         '''send sms via twilio IF twilio_enable is set to True'''
-        self.notifications.send_sms(message=message)
+        return self.notifications.send_sms(message=message, cause=cause)
+
+    def __get_cause(self, message: str) -> str:
+        '''
+        the message without this show's name/filename, so the same problem hitting
+        several shows (E.G. a destination that's down) is recognized as one cause
+        '''
+        for name in (self.show_filename, self.show):
+            if name:
+                message = message.replace(name, '')
+        return message
 
     def __send_notifications(self, message: str, subject: str, syslog_level: str = 'error'):
-        '''we generally only want to send SMS via Twilio if today is on a weekend'''
-        if today_is_weekday():
-            self.__prep_send_mail(message=message, subject=subject)
-            self.__prep_syslog(message=message, level=syslog_level)
-        else:
-            self.__send_sms_if_enabled(message=message)
-            self.__prep_send_mail(message=message, subject=subject)
-            self.__prep_syslog(message=message, level=syslog_level)
+        '''
+        we generally only want to send SMS via Twilio if today is on a weekend.
+        The channels are sent concurrently, so a slow mail server doesn't hold up syslog (or the show).
+        '''
+        with self.__recorder.stage('notify'):
+            self.__send_all_notifications(message=message, subject=subject, syslog_level=syslog_level)
+
+    def __send_all_notifications(self, message: str, subject: str, syslog_level: str):
+        cause = self.__get_cause(message=message)
+        sends = {}
+        if not today_is_weekday():
+            sends['sms'] = lambda: self.__send_sms_if_enabled(message=message, cause=cause)
+        sends['mail'] = lambda: self.__prep_send_mail(message=message, subject=subject, cause=cause)
+        sends['syslog'] = lambda: self.__prep_syslog(message=message, level=syslog_level)
+        for result in self.notifications.send_all(sends=sends):
+            if result.skipped:
+                print(f'Not sending {result.channel} notification: it has failed {self.notifications.breaker_threshold} times in a row.')
+            elif result.error is not None:
+                print(f'Unable to send {result.channel} notification: {result.error}')
 
     def __check_file_transferred(self, fileToCheck):
-        '''check if file transferred to destination(s)'''
-        numberOfDestinations = len(self.destinations) - 1
-        success = False
-        while numberOfDestinations >= 0:
-            if os.path.isfile(f'{self.destinations[numberOfDestinations]}/{fileToCheck}'):
-                numberOfDestinations = numberOfDestinations-1
-                self.__prep_syslog(message=f'{fileToCheck} arrived at {self.destinations[numberOfDestinations]}')
-                success = True
+        '''
+        check the file arrived intact at every destination.
+        The copy step already compared each copy's size and checksum with
+        the original, so we go by what it found instead of checking each share again.
+        '''
+        verified = {result.destination for result in self.__transfers if result.succeeded}
+        for destination in self.destinations:
+            if destination in verified:
+                self.__prep_syslog(message=f'{fileToCheck} arrived at {destination}')
             else:
                 toSend = (f"There was a problem with {self.show}.\n\n\
 It looks like the file either wasn't converted or didn't transfer correctly. \
 Please check manually!\n\n\
 {get_timestamp()}")
                 self.__send_notifications(message=toSend, subject='Error')
-                raise_exception_and_wait(message=toSend)
-                break
-        if success:
-            self.__countdown()
+                self.__stop(message=toSend, error=TransferError)
 
     def __check_length(self, fileToCheck):
         '''
-        Check length of converted file with ffprobe. if too long or short, send notification.
+        Check length of converted file. if too long or short, send notification.
         Notice we do not raise exceptions or halt execution. This is strictly for checking/notifying and
         troubleshooting afterwards. Do not raise exceptions here.
         '''
@@ -230,7 +441,7 @@ Please check manually!\n\n\
         self.__prep_syslog(message=f'Checking whether length is between \
 {self.check_if_below} and {self.check_if_above}')
 
-        duration = FFMPEG(input_file=fileToCheck).get_length_in_minutes()
+        duration = self.__get_length_in_minutes(fileToCheck=fileToCheck)
 
         if duration > self.check_if_above:
             toSend = (f"Today's {self.show} is {duration} minutes long! \
@@ -249,14 +460,65 @@ This is unusual and could indicate a problem with the file. Please check manuall
         
         return duration
 
+    def __get_length_in_minutes(self, fileToCheck) -> float:
+        '''
+        the WAV files we make say how long they are in their header, so we can skip ffprobe.
+        Anything else (or a WAV we can't read) goes to ffprobe as before.
+        If ffmpeg measured the file while converting it (ffmpeg.analyze), we already know.
+        '''
+        analysis = self.ffmpeg.analysis
+        if analysis and analysis.duration is not None and fileToCheck == self.ffmpeg.output_file:
+            return round(analysis.duration / 60, 2)
+        if fileToCheck.lower().endswith('.wav'):
+            try:
+                return round(read_header(fileToCheck).duration / 60, 2)
+            except (OSError, ValueError) as error:
+                self.__prep_syslog(message=f'Unable to read the WAV header ({error}). Using ffprobe instead.', level='warning')
+        return FFMPEG(input_file=fileToCheck).get_length_in_minutes()
+
+    def __log_conversion_analysis(self, fileToCheck):
+        '''what ffmpeg measured while converting (ffmpeg.analyze). Warn about any long silences.'''
+        analysis = self.ffmpeg.analysis
+        self.__prep_syslog(message=f'{fileToCheck}: integrated loudness {analysis.integrated_loudness} LUFS, \
+loudness range {analysis.loudness_range} LU, true peak {analysis.true_peak} dBFS, {len(analysis.silences)} silence(s)')
+        if analysis.silences:
+            spans = ', '.join(f'{start:.1f}-{end:.1f}' for start, end in analysis.silences)
+            self.__prep_syslog(message=f'{fileToCheck} has {analysis.silence_seconds:.1f} seconds of silence (at {spans} seconds).', level='warning')
+
+    def __analyze(self, fileToCheck):
+        '''
+        measure the converted file's levels and silence, and warn if it clipped.
+        Like __check_length, this is strictly for checking/notifying. Do not raise exceptions here.
+        '''
+        try:
+            stats = analyze(fileToCheck)
+        except (ImportError, OSError, ValueError) as error:
+            self.__prep_syslog(message=f'Unable to analyze {fileToCheck}: {error}', level='warning')
+            return
+        self.__audio = stats
+        self.__prep_syslog(message=f'{fileToCheck}: peak {stats.peak_dbfs:.1f} dBFS, RMS {stats.rms_dbfs:.1f} dBFS, \
+{stats.clipped} clipped sample(s), {stats.leading_silence:.1f} seconds of silence at the start and {stats.trailing_silence:.1f} at the end')
+        if stats.clipped:
+            self.__prep_syslog(message=f'{fileToCheck} has {stats.clipped} clipped sample(s).', level='warning')
+
     def __get_feed(self):
-        '''get the feed and create an ET object, which can then be called from other functions.'''
+        '''
+        get the feed and create an ET object, which can then be called from other functions.
+        Only the channel details and the newest item are parsed (see parse_first_item).
+        '''
         try:
             header = {'User-Agent': 'Darth Vader'}  # usually helpful to identify yourself
-            rssfeed = requests.get(self.url, headers=header)
-            rssfeed = rssfeed.text
-            rssfeed = ET.fromstring(rssfeed)
-            return rssfeed
+            cached = self.__get_cached_feed()
+            if cached:
+                header.update(cached['validators'])
+            with requests.get(self.url, headers=header, timeout=self.download_timeout, stream=True) as rssfeed:
+                if cached and rssfeed.status_code == 304:
+                    self.__prep_syslog(message='The feed has not changed since we last checked. Using the cached copy.')
+                    return ET.fromstring(cached['feed'])
+                # we only need the newest item, so stop reading as soon as we have it
+                root = parse_first_item(rssfeed.iter_content(chunk_size=64 * 1024))
+            self.__cache_feed(response=rssfeed, root=root)
+            return root
         except Exception as a:
             to_send = (
 f"There's a Problem with {self.show}. It looks like the issue is with the URL/feed. \
@@ -265,41 +527,89 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
 {get_timestamp()}"
                 )
             self.__send_notifications(subject='Error', message=to_send)
-            raise Exception (a)
+            raise FeedError(a) from a
+
+    def __get_cached_feed(self) -> dict | None:
+        '''the feed we stored the last time it changed, along with the headers needed to ask whether it has changed since'''
+        if not self.use_feed_cache:
+            return None
+        return JSONCache(directory=self.cache_dir, name='feeds').get(self.url)
+
+    def __cache_feed(self, response: requests.Response, root: ET.Element) -> None:
+        '''
+        store the parsed feed, keyed by URL. Only worth doing if the server gave us
+        an ETag or Last-Modified header, since those are what let us send a conditional request next time.
+        '''
+        if not (self.use_feed_cache and response.status_code == 200):
+            return
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = response.headers['Last-Modified']
+        if not validators:
+            return
+        try:
+            JSONCache(directory=self.cache_dir, name='feeds').set(self.url, {
+                'validators': validators,
+                'feed': ET.tostring(root, encoding='unicode'),
+            })
+        except OSError as error:
+            self.__prep_syslog(message=f'Unable to cache the feed: {error}', level='warning')
+
+    def __get_latest_episode(self) -> Episode:
+        '''
+        fetch the feed and pull out the newest item. We hold on to it so the
+        download step (and anything else that needs it) doesn't fetch the feed again.
+        '''
+        root = self.__get_feed()
+        try:
+            episode = Episode.from_feed(root)
+        except ValueError as error:
+            to_send = (
+f"There's a Problem with {self.show}. It looks like the issue is with the URL/feed. \
+Here's the error: {error}\n\n\
+{get_timestamp()}"
+                )
+            self.__send_notifications(subject='Error', message=to_send)
+            raise FeedError(error) from error
+        self.__use_episode(episode)
+        return episode
+
+    def __use_episode(self, episode: Episode) -> None:
+        self.__episode = episode
+        self.__prep_syslog(message=f'Newest episode: "{episode.title}", published {episode.pub_date}, \
+{episode.length} bytes of {episode.type}')
 
     def __check_feed_updated(self) -> bool:
         '''
-        get the ET object from the get_feed function, 
-        then parse through it to check whether there is an entry with today's date.
+        get the newest episode from the feed and check whether it has today's date.
         If yes, return True.
-
-        The format for this date is a standard format (E.G. '17 Oct 2022') set by 
-        a standards organization. Most podcasts/RSS feeds follow this standard.
         '''
-        root = self.__get_feed()
-        for channel in root.findall('channel'):
-            item = channel.find('item')  # 'find' only returns the first match!
-            pub_date = item.find('pubDate').text
-            today = datetime.now().strftime("%a, %d %b %Y")
-            if today in pub_date:
-                self.__prep_syslog(message='The feed is updated.')
-                return True
+        episode = self.__get_latest_episode()
+        if episode.is_from_today():
+            self.__prep_syslog(message='The feed is updated.')
+            return True
+        return False
 
     def __get_RSS_audio_url(self) -> str:
-        '''TODO: explain'''
-        root = self.__get_feed()
-        for channel in root.findall('channel'):
-            item = channel.find('item')  # 'find' only returns the first match!
-            audio_url = item.find('enclosure').attrib
-            audio_url = audio_url.get('url')
-            self.__prep_syslog(message=f'Audio URL is: {audio_url}')
-            return audio_url
+        '''the audio URL of the newest episode. Uses the feed we already fetched this run, if we have it.'''
+        episode = self.__episode or self.__get_latest_episode()
+        self.__prep_syslog(message=f'Audio URL is: {episode.url}')
+        return episode.url
 
     def __check_feed_loop(self) -> str:
         '''
         occasionally, the first time we check the feed, it is not showing as updated.
         It's being cached, or something...? So we are checking it 3 times, for good measure.
+
+        If FeedPoller already found today's episode, we use that and don't fetch the feed again.
         '''
+        episode, self.polled_episode = self.polled_episode, None  # only good for one run
+        if episode is not None and episode.is_from_today():
+            self.__prep_syslog(message='The feed is updated (already checked by FeedPoller).')
+            self.__use_episode(episode)
+            return True
         count = 0
         feed_updated = False
         while count < 3:
@@ -319,9 +629,11 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
         Otherwise, the user does not know what happened; they
         just see the screen disappear.
         '''
-        clear_screen()
         to_send = 'All Done.'
         self.__prep_syslog(message=to_send)
+        if self.headless:
+            return
+        clear_screen()
         print(f'{to_send}\n')
         number = 5
         i = 0
@@ -341,7 +653,7 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
         if  type(attrib_to_check) != type_to_check:
             message = f"Sorry, '{attrib_return}' attribute must be type: {type_to_check}, but you used {type(attrib_to_check)}."
             self.__send_notifications(message=message, subject="Error")
-            raise_exception_and_wait(message=message)
+            self.__stop(message=message, error=InvalidAttributeError)
 
     def __check_int_and_float_type(self, attrib_to_check, attrib_return: str):
         '''
@@ -350,7 +662,7 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
         if not (type(attrib_to_check) == int or type(attrib_to_check) == float):
             message = f'Sorry, the {attrib_return} attribute must be a valid number (without quotes).'
             self.__send_notifications(message=message, subject="Error")
-            raise_exception_and_wait(message=message)
+            self.__stop(message=message, error=InvalidAttributeError)
 
     def __check_attributes_are_valid(self):
         '''
@@ -362,14 +674,14 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
         if not self.show:
             message = 'Sorry, you need to specify a name for the show.'
             self.__send_notifications(message=message, subject="Error")
-            raise_exception_and_wait(message=message)
+            self.__stop(message=message, error=InvalidAttributeError)
         else:
             self.__check_str_and_bool_type(attrib_to_check=self.show, type_to_check=str, attrib_return='show')
 
         if not self.show_filename:
             message = 'Sorry, you need to specify a filename for the show.'
             self.__send_notifications(message=message, subject="Error")
-            raise_exception_and_wait(message=message)
+            self.__stop(message=message, error=InvalidAttributeError)
         else:
             self.__check_str_and_bool_type(attrib_to_check=self.show_filename, type_to_check=str, attrib_return='show_filename')
 
@@ -377,17 +689,17 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
             if not self.is_local:
                 message = 'Sorry, you need to specify either a URL or a local file'
                 self.__send_notifications(message=message, subject="Error")
-                raise_exception_and_wait('Sorry, you need to specify either a URL or a local file')
+                self.__stop(message=message, error=InvalidAttributeError)
 
         if self.url and self.is_local:
             message = 'Sorry, you cannot specify both a URL and a local audio file. You must choose only one.'
             self.__send_notifications(message=message, subject="Error")
-            raise_exception_and_wait(message=message)
+            self.__stop(message=message, error=InvalidAttributeError)
         
         if self.url and self.local_file:
             message = 'Sorry, you cannot specify both a URL and a local audio file. You must choose only one.'
             self.__send_notifications(message=message, subject="Error")
-            raise_exception_and_wait(message=message)
+            self.__stop(message=message, error=InvalidAttributeError)
 
         if self.url:
             self.__check_str_and_bool_type(attrib_to_check=self.url, type_to_check=str, attrib_return='url')
@@ -407,6 +719,27 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
         if self.is_permalink:
             self.__check_str_and_bool_type(attrib_to_check=self.is_permalink, type_to_check=bool, attrib_return='is_permalink')
 
+        if self.stream_convert:
+            self.__check_str_and_bool_type(attrib_to_check=self.stream_convert, type_to_check=bool, attrib_return='stream_convert')
+
+        if self.analyze_audio:
+            self.__check_str_and_bool_type(attrib_to_check=self.analyze_audio, type_to_check=bool, attrib_return='analyze_audio')
+
+        if self.headless:
+            self.__check_str_and_bool_type(attrib_to_check=self.headless, type_to_check=bool, attrib_return='headless')
+
+        if self.ffmpeg.analyze:
+            self.__check_str_and_bool_type(attrib_to_check=self.ffmpeg.analyze, type_to_check=bool, attrib_return='analyze')
+
+        if self.ffmpeg.two_pass:
+            self.__check_str_and_bool_type(attrib_to_check=self.ffmpeg.two_pass, type_to_check=bool, attrib_return='two_pass')
+
+        if self.ffmpeg.output_cache:
+            self.__check_str_and_bool_type(attrib_to_check=self.ffmpeg.output_cache, type_to_check=bool, attrib_return='output_cache')
+
+        if self.skip_unchanged:
+            self.__check_str_and_bool_type(attrib_to_check=self.skip_unchanged, type_to_check=bool, attrib_return='skip_unchanged')
+
         if not (self.check_if_above and self.check_if_below):
             print('\n(You did not specify check_if_below and/or check_if_above. These checks will not be run.')
         
@@ -425,54 +758,202 @@ Is this a permalink show? Did you forget to set the is_permalink attribute?\n\n\
         if self.notifications.email_enable:
             self.__check_str_and_bool_type(attrib_to_check=self.notifications.email_enable, type_to_check=bool, attrib_return='twilio_enable')
 
-    def run(self):
-        '''begins to process the file'''
+    def run(self) -> RunResult:
+        '''
+        begins to process the file. Returns a RunResult if everything worked;
+        otherwise raises a ShowError (see talklib.errors) once the notifications have gone out.
+        Either way, self.last_run holds the timings (see talklib.metrics).
+        '''
+        profiler = self.__get_profiler()
+        self.__recorder = RunRecorder(show=self.show, profiler=profiler)
+        try:
+            output_file = self.__run()
+        except BaseException as error:
+            self.__report_run(record=self.__recorder.finish(error=error))
+            raise
+        finally:
+            if profiler:
+                try:
+                    profiler.stop()
+                except Exception as error:
+                    self.__prep_syslog(message=f'Unable to stop profiling: {error}', level='warning')
+        record = self.__recorder.finish()
+        self.__report_run(record=record)
+        if any(result.succeeded for result in self.__transfers):
+            self.__countdown()
+        return RunResult(show=self.show, output_file=output_file, seconds=record.seconds,
+                         episode=self.__episode, transfers=self.__transfers, record=record, audio=self.__audio,
+                         conversion=self.ffmpeg.analysis, unchanged=self.__unchanged)
+
+    def __get_profiler(self):
+        '''only when profiling is turned on. The profiling module isn't even imported otherwise.'''
+        if not self.profile_dir:
+            return None
+        from talklib.profiling import StageProfiler
+        profiler = StageProfiler(directory=self.profile_dir, name=self.show_filename or 'show',
+                                 log=lambda message: self.__prep_syslog(message=message, level='warning'))
+        try:
+            profiler.start()
+        except Exception as error:
+            self.__prep_syslog(message=f'Unable to profile this run: {error}', level='warning')
+            return None
+        self.__prep_syslog(message=f'Profiling this run. The results will be saved in {self.profile_dir}')
+        return profiler
+
+    def __report_run(self, record: RunRecord):
+        '''hand the run's timings to whatever wants them. A problem here never fails the show.'''
+        self.last_run = record
+        outputs = []
+        if self.metrics_syslog:
+            outputs.append(lambda: self.__prep_syslog(message=f'run record {record.to_json()}'))
+        if self.metrics_jsonl:
+            outputs.append(lambda: append_jsonl(record=record, path=self.metrics_jsonl))
+        if self.metrics_textfile_dir:
+            outputs.append(lambda: write_textfile(record=record, directory=self.metrics_textfile_dir, name=self.show_filename))
+        outputs.extend(lambda hook=hook: hook(record) for hook in self.run_hooks)
+        for output in outputs:
+            try:
+                output()
+            except Exception as error:
+                self.__prep_syslog(message=f'Unable to report run timings: {error}', level='warning')
 
+    def __run(self) -> str:
         self.__prep_syslog(message=f'Starting script')
+        self.__episode = None
+        self.__transfers = []
+        self.__audio = None
+        self.__identity = None
+        self.__unchanged = False
+        self.ffmpeg.analysis = None
         print(f"I'm working on {self.show}. Just a moment...\n")
 
         self.__check_attributes_are_valid()
 
         if self.url and self.is_permalink:
             self.__prep_syslog(message='permalink show detected')
-            self.__run_URL_permalink()
+            output_file = self.__run_URL_permalink()
 
         # if url but not permalink, it must be an RSS feed...right?
         elif self.url:
             self.__prep_syslog(message='URL show detected')
-            self.__run_URL_RSS()
+            output_file = self.__run_URL_RSS()
 
         elif self.is_local:
             self.__prep_syslog(message='local show detected')
-            self.__run_local()
+            output_file = self.__run_local()
                    
         else:
             message = "Sorry, something bad happened..."
             self.__send_notifications(message=message, subject="Error")
-            raise_exception_and_wait(message=message)
+            self.__stop(message=message)
+        return output_file
 
-    def __run_URL_permalink(self):
-        # if url is declared, it's either an RSS or permalink show
-        if self.url and self.is_permalink:
-            self.__remove_yesterday_files()
-            downloaded_file = self.__download_file()
-            if self.check_downloaded_file(fileToCheck=downloaded_file, how_many_attempts=0):
-                output_file = self.__convert(input=downloaded_file)
+    def __stop(self, message: str, error: type = ShowError):
+        '''
+        stop processing the show. Normally we make sure someone sees the message before the window closes.
+        In headless mode nobody is watching, so just raise.
+        '''
+        if self.headless:
+            raise error(message)
+        raise_exception_and_wait(message=message, error=error)
+
+    def __deliver(self, output_file: str):
+        '''check the converted file, copy it to the destinations and make sure it got there'''
+        if self.ffmpeg.analysis:
+            self.__log_conversion_analysis(fileToCheck=output_file)
+        with self.__recorder.stage('check_length'):
             self.__check_length(fileToCheck=output_file)
-            self.__remove(fileToDelete=downloaded_file)
+        if self.analyze_audio:
+            with self.__recorder.stage('analyze'):
+                self.__analyze(fileToCheck=output_file)
+        with self.__recorder.stage('copy') as stage:
             self.__copy_then_remove(fileToCopy=output_file)
+            stage.succeeded = all(result.succeeded for result in self.__transfers)
+        with self.__recorder.stage('verify'):
             self.__check_file_transferred(fileToCheck=output_file)
+        if self.skip_unchanged and self.__transfers and all(result.succeeded for result in self.__transfers):
+            self.__save_delivered(output_file=output_file)
+
+    def __delivered_state(self) -> JSONCache:
+        return JSONCache(directory=self.cache_dir, name='delivered')
 
-    def __run_URL_RSS(self):
-        if self.__check_feed_loop():
+    def __is_unchanged(self, identity: dict | None) -> bool:
+        '''
+        whether identity matches the episode we last delivered, and that file is still in every destination.
+        Remembers identity, so it can be saved once this episode has been delivered.
+        '''
+        self.__identity = identity
+        if not identity:
+            return False
+        delivered = self.__delivered_state().get(self.show_filename)
+        if not delivered or delivered.get('identity') != identity:
+            return False
+        for destination in self.destinations:
+            if not os.path.exists(os.path.join(destination, delivered['output_file'])):
+                self.__prep_syslog(message=f'The episode is unchanged, but {delivered["output_file"]} is missing from {destination}. Delivering it again.')
+                return False
+        self.__prep_syslog(message=f'The episode is unchanged since it was delivered at {delivered["delivered"]}. Nothing to do.')
+        self.__unchanged = True
+        return True
+
+    def __save_delivered(self, output_file: str):
+        if not self.__identity:
+            return
+        try:
+            self.__delivered_state().set(self.show_filename, {
+                'identity': self.__identity,
+                'output_file': os.path.basename(output_file),
+                'delivered': get_timestamp(),
+            })
+        except OSError as error:
+            self.__prep_syslog(message=f'Unable to save which episode was delivered: {error}', level='warning')
+
+    def __get_episode_identity(self) -> dict | None:
+        '''what the newest RSS episode looks like. The feed is already fetched, so this costs nothing'''
+        episode = self.__episode
+        if episode is None:
+            return None
+        return {'url': episode.url, 'length': episode.length, 'pub_date': episode.pub_date}
+
+    def __get_permalink_identity(self) -> dict | None:
+        '''
+        what the permalink's audio looks like, from a HEAD request (so nothing is downloaded).
+        Only the server's ETag or Last-Modified say whether the file changed; without either we can't tell.
+        '''
+        try:
+            response = requests.head(self.url, allow_redirects=True, timeout=self.download_timeout)
+            response.raise_for_status()
+        except requests.RequestException as error:
+            self.__prep_syslog(message=f'Unable to check whether {self.url} has changed: {error}', level='warning')
+            return None
+        headers = response.headers
+        if not (headers.get('ETag') or headers.get('Last-Modified')):
+            return None
+        return {'url': response.url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'),
+                'length': headers.get('Content-Length')}
+
+    def __run_URL_permalink(self) -> str:
+        # if url is declared, it's either an RSS or permalink show
+        if self.url and self.is_permalink:
+            if self.skip_unchanged:
+                with self.__recorder.stage('head'):
+                    if self.__is_unchanged(identity=self.__get_permalink_identity()):
+                        return None
             self.__remove_yesterday_files()
-            downloaded_file = self.__download_file()
-            if self.check_downloaded_file(fileToCheck=downloaded_file, how_many_attempts=0):
-                output_file = self.__convert(input=downloaded_file)
-            self.__check_length(fileToCheck=output_file)
-            self.__remove(fileToDelete=downloaded_file)
-            self.__copy_then_remove(fileToCopy=output_file)
-            self.__check_file_transferred(fileToCheck=output_file)
+            output_file = self.__get_output_file_from_URL()
+            self.__deliver(output_file=output_file)
+            return output_file
+
+    def __run_URL_RSS(self) -> str:
+        with self.__recorder.stage('feed'):
+            feed_updated = self.__check_feed_loop()
+        if feed_updated:
+            if self.skip_unchanged and self.__is_unchanged(identity=self.__get_episode_identity()):
+                return None
+            self.__remove_yesterday_files()
+            output_file = self.__get_output_file_from_URL()
+            self.__deliver(output_file=output_file)
+            return output_file
         else:
             toSend = (
 f"There was a problem with {self.show}.\n\n\
@@ -480,16 +961,15 @@ It looks like today's file hasn't yet been posted. Please check and download man
 {get_timestamp()}"
                 )
             self.__send_notifications(message=toSend, subject='Error')
-            raise_exception_and_wait(message=toSend)
+            self.__stop(message=toSend, error=FeedNotUpdatedError)
     
-    def __run_local(self):
+    def __run_local(self) -> str:
         if self.local_file:
             if self.check_downloaded_file(fileToCheck=self.local_file, how_many_attempts=0):
                 output_file = self.__convert(input=self.local_file)
-            self.__check_length(fileToCheck=output_file)
             self.__remove(fileToDelete=self.local_file)
-            self.__copy_then_remove(fileToCopy=output_file)
-            self.__check_file_transferred(fileToCheck=output_file)
+            self.__deliver(output_file=output_file)
+            return output_file
         else:
             to_send = (
 f"There was a problem with {self.show}.\n\n\
@@ -497,4 +977,4 @@ It looks like the source file doesn't exist. Please check manually! Yesterday's
 {get_timestamp()}"
                 )
             self.__send_notifications(message=to_send, subject='Error')
-            raise_exception_and_wait(message=to_send, error=FileNotFoundError)
\ No newline at end of file
+            self.__stop(message=to_send, error=SourceFileNotFoundError)
@@ -0,0 +1,170 @@
+'''
+Copying finished files to the destinations (OnAir PC, Production PC, etc.).
+
+Every destination is copied to at the same time, and each copy is written
+under a temporary name and renamed into place only once its size and
+checksum match the source, so the playout system never picks up a
+half-written (or truncated) file.
+
+The source is only read once: either we read it a chunk at a time, hashing
+each chunk and writing it to every destination, or (where the OS supports it)
+the kernel copies the file for us while we hash the source alongside.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import os
+import shutil
+import time
+
+CHUNK_SIZE = 1024 * 1024
+
+# copy_file_range lets the kernel copy between files (without the data passing
+# through Python, and server-side on network filesystems that support it). Linux only.
+FAST_COPY = hasattr(os, 'copy_file_range')
+
+
+@dataclass
+class TransferResult:
+    '''the outcome of copying one file to one destination'''
+    destination: str
+    bytes: int = 0
+    seconds: float = 0
+    digest: str = None  # sha256 of the file as it arrived at the destination
+    error: Exception = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def file_digest(path: str) -> tuple:
+    '''return (size in bytes, sha256 hex digest) of a file, read a chunk at a time'''
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, mode='rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+            size = size + len(chunk)
+    return size, digest.hexdigest()
+
+
+def _kernel_copy(source: str, target: str) -> None:
+    '''copy with copy_file_range, falling back to shutil (which uses sendfile where it can)'''
+    with open(source, mode='rb') as src, open(target, mode='wb') as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if not copied:
+                    break
+                remaining = remaining - copied
+            return
+        except OSError:
+            pass  # not supported between these two filesystems
+    shutil.copyfile(source, target)
+
+
+def _fan_out_copy(source: str, targets: list, executor: ThreadPoolExecutor) -> tuple:
+    '''
+    read source once, hashing it and writing each chunk to every target concurrently.
+    Returns (size, digest, errors, seconds), with an Exception (or None) and the time spent writing per target.
+    '''
+    files = []
+    errors = []
+    seconds = [0.0] * len(targets)
+    for target in targets:
+        try:
+            files.append(open(target, mode='wb'))
+            errors.append(None)
+        except OSError as error:
+            files.append(None)
+            errors.append(error)
+
+    def write(index: int, chunk: bytes) -> None:
+        if errors[index] is not None:
+            return
+        start = time.monotonic()
+        try:
+            files[index].write(chunk)
+        except OSError as error:
+            errors[index] = error
+        seconds[index] = seconds[index] + time.monotonic() - start
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(source, mode='rb') as src:
+            while chunk := src.read(CHUNK_SIZE):
+                digest.update(chunk)
+                size = size + len(chunk)
+                list(executor.map(write, range(len(files)), [chunk] * len(files)))
+    finally:
+        for index, file in enumerate(files):
+            if file is None:
+                continue
+            try:
+                file.close()
+            except OSError as error:
+                errors[index] = errors[index] or error
+    return size, digest.hexdigest(), errors, seconds
+
+
+def _finish(temp_path: str, final_path: str, size: int, digest: str, result: TransferResult) -> TransferResult:
+    '''check the copy against the source, then rename it into place. Otherwise remove it.'''
+    start = time.monotonic()
+    try:
+        if result.error is None:
+            result.bytes, result.digest = file_digest(temp_path)
+            if (result.bytes, result.digest) != (size, digest):
+                raise IOError(f'the copy does not match the source ({result.bytes} of {size} bytes, checksum {result.digest})')
+            os.replace(temp_path, final_path)
+            result.seconds = result.seconds + time.monotonic() - start
+            return result
+    except Exception as error:
+        result.error = error
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+    result.seconds = result.seconds + time.monotonic() - start
+    return result
+
+
+def _timed_copy(source: str, target: str) -> tuple:
+    '''kernel copy that returns (the exception it raised or None, seconds taken) instead of raising'''
+    start = time.monotonic()
+    try:
+        _kernel_copy(source, target)
+        return None, time.monotonic() - start
+    except Exception as error:
+        return error, time.monotonic() - start
+
+
+def copy_to_destinations(source: str, destinations: list, max_workers: int = 4) -> list:
+    '''
+    copy source to every destination concurrently, verify each copy's size and checksum,
+    then rename it into place. Returns a TransferResult per destination, in the same order.
+    '''
+    if not destinations:
+        return []
+    filename = os.path.basename(source)
+    # the temporary name doesn't end in .wav, so nothing matching *.wav ever sees it
+    temp_paths = [os.path.join(destination, f'{filename}.partial') for destination in destinations]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(destinations)))) as executor:
+        if FAST_COPY:
+            with ThreadPoolExecutor(max_workers=1) as hasher:
+                source_digest = hasher.submit(file_digest, source)
+                errors, seconds = zip(*executor.map(lambda temp_path: _timed_copy(source, temp_path), temp_paths))
+                size, digest = source_digest.result()
+        else:
+            size, digest, errors, seconds = _fan_out_copy(source=source, targets=temp_paths, executor=executor)
+
+        results = [TransferResult(destination=destination, seconds=time_taken, error=error)
+                   for destination, time_taken, error in zip(destinations, seconds, errors)]
+        final_paths = [os.path.join(destination, filename) for destination in destinations]
+        return list(executor.map(lambda temp_path, final_path, result: _finish(temp_path, final_path, size, digest, result),
+                                 temp_paths, final_paths, results))
+
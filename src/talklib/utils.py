@@ -3,6 +3,7 @@ import os
 
 import requests
 
+from talklib.ev import EV
 from talklib.notify import Notify
 
 def get_timestamp() -> str:
@@ -35,8 +36,8 @@ def today_is_weekday() -> bool:
 def metadata_to_icecast(title):
     notify = Notify()
     notify.syslog.send_syslog_message(message=f'attempting to send "{title}" to Icecast')
-    user = os.environ['icecast_user']
-    password = os.environ['icecast_pass']
+    user = EV().icecast_user
+    password = EV().icecast_pass
     url = f'https://npl.streamguys1.com:80/admin/metadata?mount=/live&mode=updinfo&song={title}'
     send = requests.get(url, auth = (user, password))
     if send.status_code == 200:
@@ -0,0 +1,163 @@
+'''
+Reading the WAV files we make, without running ffprobe.
+
+read_header() gets the format and length from the file's header, which is all
+checking the length needs (a few microseconds, instead of starting a subprocess).
+
+analyze() goes through the audio itself: peak and RMS level, how many samples
+clipped, and how much silence there is at the start and end. It needs NumPy
+(optional, and not installed with talklib), and maps the file into memory a block
+at a time, so even a long show doesn't need much RAM.
+'''
+
+from dataclasses import dataclass
+import math
+import os
+import struct
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+@dataclass
+class WavInfo:
+    '''what the header of a WAV file says about the audio in it'''
+    sample_rate: int
+    channels: int
+    bits_per_sample: int
+    format_tag: int  # WAVE_FORMAT_PCM or WAVE_FORMAT_IEEE_FLOAT
+    data_offset: int  # where the audio starts in the file
+    data_size: int  # bytes of audio
+
+    @property
+    def block_align(self) -> int:
+        '''bytes per frame (one sample for every channel)'''
+        return self.channels * self.bits_per_sample // 8
+
+    @property
+    def frames(self) -> int:
+        return self.data_size // self.block_align
+
+    @property
+    def duration(self) -> float:
+        '''in seconds'''
+        return self.frames / self.sample_rate
+
+
+@dataclass
+class AudioStats:
+    '''levels are relative to full scale: 1.0 (0 dBFS) is as loud as the format allows'''
+    duration: float  # seconds
+    peak: float
+    rms: float
+    clipped: int  # samples at full scale
+    leading_silence: float  # seconds of silence before the audio starts
+    trailing_silence: float  # seconds of silence after it ends
+
+    @property
+    def peak_dbfs(self) -> float:
+        return 20 * math.log10(self.peak) if self.peak else -math.inf
+
+    @property
+    def rms_dbfs(self) -> float:
+        return 20 * math.log10(self.rms) if self.rms else -math.inf
+
+
+def read_header(path: str) -> WavInfo:
+    '''read the format and size of a WAV file. Raises ValueError if it isn't one we can read.'''
+    with open(path, mode='rb') as file:
+        start = file.read(12)
+        if len(start) < 12 or start[:4] != b'RIFF' or start[8:] != b'WAVE':
+            raise ValueError(f'{path} is not a WAV file')
+        file_size = os.fstat(file.fileno()).st_size
+
+        fmt = None
+        while header := file.read(8):
+            if len(header) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = file.read(chunk_size)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f'{path} has no format (fmt) chunk before its audio')
+                data_offset = file.tell()
+                # a WAV written to a pipe can't go back and fill in the size, so it may be 0 or 0xFFFFFFFF
+                if chunk_size in (0, 0xFFFFFFFF) or data_offset + chunk_size > file_size:
+                    chunk_size = file_size - data_offset
+                return _parse_fmt(path, fmt, data_offset, chunk_size)
+            else:
+                file.seek(chunk_size, os.SEEK_CUR)
+            if chunk_size % 2:
+                file.seek(1, os.SEEK_CUR)  # chunks are padded to an even length
+    raise ValueError(f'{path} has no audio (data) chunk')
+
+def _parse_fmt(path: str, fmt: bytes, data_offset: int, data_size: int) -> WavInfo:
+    if len(fmt) < 16:
+        raise ValueError(f'{path} has a format (fmt) chunk that is too short')
+    format_tag, channels, sample_rate, _, _, bits_per_sample = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack('<H', fmt[24:26])[0]  # the first two bytes of the SubFormat GUID
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise ValueError(f'{path} is compressed (format {format_tag:#x}), not PCM')
+    if not (channels and sample_rate and bits_per_sample):
+        raise ValueError(f'{path} has an invalid format (fmt) chunk')
+    return WavInfo(sample_rate=sample_rate, channels=channels, bits_per_sample=bits_per_sample,
+                   format_tag=format_tag, data_offset=data_offset, data_size=data_size)
+
+
+def _sample_format(info: WavInfo) -> tuple:
+    '''(numpy dtype, full scale, the value of silence, the level that counts as clipped) for the file's samples'''
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT and info.bits_per_sample in (32, 64):
+        return f'<f{info.bits_per_sample // 8}', 1.0, 0, 1.0
+    if info.format_tag == WAVE_FORMAT_PCM and info.bits_per_sample == 8:
+        return 'u1', 128, 128, 127  # 8 bit WAVs are unsigned
+    if info.format_tag == WAVE_FORMAT_PCM and info.bits_per_sample in (16, 32):
+        full_scale = 2 ** (info.bits_per_sample - 1)
+        return f'<i{info.bits_per_sample // 8}', full_scale, 0, full_scale - 1
+    raise ValueError(f'{info.bits_per_sample} bit audio is not supported')
+
+
+def analyze(path: str, silence_threshold: float = -60, block_frames: int = 1024 * 1024) -> AudioStats:
+    '''
+    measure the audio in a WAV file in one pass. Anything quieter than silence_threshold
+    (in dBFS) counts as silence. Raises ImportError if NumPy isn't installed.
+    '''
+    import numpy
+
+    info = read_header(path)
+    dtype, full_scale, zero, clip = _sample_format(info)
+    frames = info.frames
+    if not frames:
+        return AudioStats(duration=0, peak=0, rms=0, clipped=0, leading_silence=0, trailing_silence=0)
+
+    samples = numpy.memmap(path, dtype=dtype, mode='r', offset=info.data_offset, shape=(frames, info.channels))
+    silence = full_scale * 10 ** (silence_threshold / 20)
+
+    peak = 0.0
+    sum_of_squares = 0.0
+    clipped = 0
+    first_sound = None
+    last_sound = None
+    for start in range(0, frames, block_frames):
+        block = numpy.abs(samples[start:start + block_frames].astype(numpy.float64) - zero)
+        peak = max(peak, float(block.max()))
+        sum_of_squares = sum_of_squares + float(numpy.square(block).sum())
+        clipped = clipped + int(numpy.count_nonzero(block >= clip))
+        loud = numpy.flatnonzero(block.max(axis=1) > silence)
+        if loud.size:
+            first_sound = start + int(loud[0]) if first_sound is None else first_sound
+            last_sound = start + int(loud[-1])
+    del samples
+
+    if first_sound is None:  # it's all silence
+        first_sound, last_sound = frames, -1
+    return AudioStats(
+        duration=info.duration,
+        peak=peak / full_scale,
+        rms=math.sqrt(sum_of_squares / (frames * info.channels)) / full_scale,
+        clipped=clipped,
+        leading_silence=first_sound / info.sample_rate,
+        trailing_silence=(frames - 1 - last_sound) / info.sample_rate,
+    )
@@ -0,0 +1,46 @@
+'''
+Compare parsing a whole feed with ET.fromstring against parse_first_item,
+on synthetic feeds of increasing size.
+
+This is not collected by pytest. Run it from the src folder:
+
+    python -m tests.benchmarks.feed_parse
+'''
+
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from talklib.feed import Episode, parse_first_item
+from ..mock import make_feed
+
+CHUNK_SIZE = 64 * 1024  # same chunk size TLShow uses for feeds
+
+
+def chunked(feed: bytes):
+    for start in range(0, len(feed), CHUNK_SIZE):
+        yield feed[start:start + CHUNK_SIZE]
+
+def measure(parse, feed: bytes, repeat: int = 5) -> tuple:
+    '''best time in ms over a few runs, and peak memory in KB of one run'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Episode.from_feed(parse(feed))
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    Episode.from_feed(parse(feed))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times) * 1000, peak / 1024
+
+def main():
+    print(f'{"items":>7} {"feed KB":>9} {"full ms":>9} {"full KB":>9} {"first ms":>9} {"first KB":>9}')
+    for items in (100, 1_000, 10_000, 50_000):
+        feed = make_feed(items=items)
+        full_ms, full_kb = measure(lambda feed: ET.fromstring(feed), feed)
+        first_ms, first_kb = measure(lambda feed: parse_first_item(chunked(feed)), feed)
+        print(f'{items:>7} {len(feed) / 1024:>9.0f} {full_ms:>9.2f} {full_kb:>9.0f} {first_ms:>9.2f} {first_kb:>9.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import ffmpeg
 import os
 import requests
 import shutil
+import socketserver
+import threading
 
 
 '''
@@ -48,4 +53,143 @@ def download_test_file():
             downloaded_file.write(a.content)
             downloaded_file.close()
             return downloaded_file.name
-    return downloaded_file
\ No newline at end of file
+    return downloaded_file
+
+
+def make_feed(items: int = 3, audio_url: str = 'https://somesite.org/audio.mp3') -> bytes:
+    '''an RSS feed whose newest item is dated today. The rest go back one day at a time'''
+    entries = []
+    for number in range(items):
+        pub_date = (datetime.now() - timedelta(days=number)).strftime('%a, %d %b %Y 06:00:00 -0500')
+        entries.append(
+f"""<item><title>Episode {number}</title><description>{'back catalogue ' * 20}</description>
+<pubDate>{pub_date}</pubDate>
+<enclosure url="{audio_url}" length="12345" type="audio/mpeg"/></item>"""
+        )
+    feed = f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Test Feed</title>{''.join(entries)}</channel></rss>"""
+    return feed.encode('utf-8')
+
+def make_audio(seconds: int | float, format: str = 'mp3') -> bytes:
+    '''generate a tone with ffmpeg, so tests have real audio without downloading any'''
+    stream = ffmpeg.input(f'sine=frequency=440:duration={seconds}', f='lavfi')
+    stream = ffmpeg.output(stream, 'pipe:', f=format, ac=1, ar=44100)
+    audio, _ = ffmpeg.run(stream, capture_stdout=True, quiet=True)
+    return audio
+
+
+class LocalServer:
+    '''
+    A tiny HTTP server on localhost, so tests don't depend on the internet.
+
+    routes maps a path to a (status, headers, body) tuple. Every request's
+    method, path and headers are recorded in self.requests, and the body of
+    every POST in self.bodies.
+    '''
+    def __init__(self, routes: dict = None):
+        self.routes = routes if routes is not None else {}
+        self.requests = []
+        self.bodies = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_POST(self):
+                server.bodies.append(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                self.respond(send_body=True)
+
+            def respond(self, send_body: bool):
+                server.requests.append((self.command, self.path, dict(self.headers)))
+                status, headers, body = server.routes.get(self.path, (404, {}, b''))
+                if callable(body):
+                    status, headers, body = body(self)
+                self.send_response(status)
+                headers = {'Content-Length': str(len(body)), **headers}
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if send_body:
+                    try:
+                        self.wfile.write(body)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class LocalSMTPServer:
+    '''
+    A minimal SMTP server on localhost. Just enough of the protocol for smtplib.
+    Counts connections and commands, and keeps every message it receives.
+
+    `replies` overrides the reply to a command (or to '.' at the end of a message);
+    a reply of None hangs up without answering.
+    '''
+    def __init__(self, replies: dict = {}):
+        self.connections = 0
+        self.commands = []
+        self.messages = []
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str):
+                self.wfile.write(f'{line}\r\n'.encode())
+
+            def handle(self):
+                server.connections = server.connections + 1
+                self.reply('220 localhost ready')
+                while line := self.rfile.readline():
+                    command = line.decode().strip().upper()
+                    verb = command.split(' ')[0]
+                    server.commands.append(verb)
+                    if verb in replies:
+                        if replies[verb] is None:
+                            return
+                        self.reply(replies[verb])
+                    elif command.startswith('EHLO') or command.startswith('HELO'):
+                        self.reply('250 localhost')
+                    elif command == 'DATA':
+                        self.reply('354 go ahead')
+                        data = b''
+                        while (line := self.rfile.readline()) != b'.\r\n':
+                            data = data + line
+                        server.messages.append(data)
+                        if '.' in replies and replies['.'] is None:
+                            return
+                        self.reply(replies.get('.', '250 queued'))
+                    elif command == 'QUIT':
+                        self.reply('221 bye')
+                        return
+                    else:
+                        self.reply('250 OK')
+
+        self.tcp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.tcp.daemon_threads = True
+        self.host = f'127.0.0.1:{self.tcp.server_address[1]}'
+        self.thread = threading.Thread(target=self.tcp.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.tcp.shutdown()
+        self.tcp.server_close()
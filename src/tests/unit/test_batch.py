@@ -0,0 +1,130 @@
+import os
+import pickle
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from talklib import TLShow, TLShowBatch
+from ..mock import env_vars
+
+
+class SlowShow(TLShow):
+    '''stand-in for a real show. sleeps instead of downloading/converting'''
+    def run(self):
+        time.sleep(0.2)
+        if self.show == 'Broken':
+            raise Exception('something went wrong')
+        if self.show == 'Crash':
+            os._exit(1)  # the worker process dies
+
+
+def make_show(name: str) -> TLShow:
+    with patch.dict('os.environ', env_vars):
+        show = SlowShow()
+    show.show = name
+    show.show_filename = name.replace(' ', '_')
+    show.notifications.enable_all = False
+    return show
+
+@pytest.fixture
+def template_batch():
+    batch = TLShowBatch(shows=[make_show(f'Show {number}') for number in range(4)], max_workers=4)
+    yield batch
+
+
+def test_run_returns_result_per_show(template_batch: TLShowBatch):
+    results = template_batch.run()
+    assert [result.show for result in results] == [show.show for show in template_batch.shows]
+    assert all(result.succeeded for result in results)
+
+def test_run_is_concurrent(template_batch: TLShowBatch):
+    '''four shows that take 0.2 seconds each should take about 0.2 seconds total, not 0.8'''
+    start = time.monotonic()
+    template_batch.run()
+    assert time.monotonic() - start < 0.6
+
+def test_max_workers_limits_concurrency(template_batch: TLShowBatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+    def fake_run(self):
+        with lock:
+            running.append(self)
+            peak.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.remove(self)
+    template_batch.max_workers = 2
+    with patch.object(SlowShow, 'run', fake_run):
+        template_batch.run()
+    assert max(peak) == 2
+
+def test_failed_show_is_isolated(template_batch: TLShowBatch):
+    template_batch.add(make_show('Broken'))
+    results = template_batch.run()
+    assert [result.succeeded for result in results] == [True, True, True, True, False]
+    assert 'something went wrong' in str(results[-1].error)
+
+def test_shows_run_headless(template_batch: TLShowBatch):
+    headless = []
+    def fake_run(self):
+        headless.append(self.headless)
+    with patch.object(SlowShow, 'run', fake_run):
+        template_batch.run()
+    assert headless == [True, True, True, True]
+
+def test_no_profiling_on_threads(template_batch: TLShowBatch):
+    '''shows on threads share tracemalloc and cProfile, so their profiles would be mixed up'''
+    for show in template_batch.shows:
+        show.profile_dir = 'profiles'
+    template_batch.run()
+    assert [show.profile_dir for show in template_batch.shows] == [None] * 4
+
+def test_report(template_batch: TLShowBatch):
+    template_batch.add(make_show('Broken'))
+    template_batch.run()
+    assert template_batch.report().startswith('4 of 5 show(s) succeeded.')
+
+def test_processes(template_batch: TLShowBatch):
+    template_batch.use_processes = True
+    template_batch.max_workers = 2
+    assert all(result.succeeded for result in template_batch.run())
+
+def test_real_show_pickles():
+    '''with use_processes, each show is pickled to send it to its worker'''
+    with patch.dict('os.environ', env_vars):
+        show = TLShow()
+    show.show = 'Real Show'
+    show.run_hooks.append(print)
+    copy = pickle.loads(pickle.dumps(show))
+    assert copy.show == 'Real Show' and copy.destinations == show.destinations
+
+def test_processes_unpicklable_show(template_batch: TLShowBatch):
+    '''a show that can't be sent to a process fails on its own; the rest of the batch still runs'''
+    with patch.dict('os.environ', env_vars):
+        show = TLShow()
+    show.show = 'Unpicklable'
+    show.show_filename = 'unpicklable'
+    show.run_hooks.append(lambda record: None)
+    template_batch.add(show)
+    template_batch.use_processes = True
+    results = template_batch.run()
+    assert [result.succeeded for result in results] == [True, True, True, True, False]
+    assert results[4].show == 'Unpicklable' and results[4].error is not None
+
+def test_processes_worker_crash(template_batch: TLShowBatch):
+    template_batch.shows = [make_show('Crash')]
+    template_batch.use_processes = True
+    results = template_batch.run()
+    assert len(results) == 1 and not results[0].succeeded
+
+def test_duplicate_filenames_rejected(template_batch: TLShowBatch):
+    template_batch.add(make_show('Show 0'))
+    with pytest.raises(ValueError):
+        template_batch.run()
+
+def test_invalid_max_workers(template_batch: TLShowBatch):
+    template_batch.max_workers = 0
+    with pytest.raises(ValueError):
+        template_batch.run()
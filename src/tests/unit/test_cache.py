@@ -0,0 +1,23 @@
+import pytest
+
+from talklib.cache import atomic_write, JSONCache
+
+
+def test_atomic_write(tmp_path):
+    path = tmp_path / 'file.txt'
+    with atomic_write(str(path)) as file:
+        file.write('first')
+    with pytest.raises(RuntimeError):
+        with atomic_write(str(path)) as file:
+            file.write('half of the second')
+            raise RuntimeError('interrupted')
+    assert path.read_text() == 'first'  # the failed write left it alone
+    assert [file.name for file in tmp_path.iterdir()] == ['file.txt']  # and didn't leave a temporary file behind
+
+def test_json_cache(tmp_path):
+    cache = JSONCache(directory=str(tmp_path), name='test')
+    assert cache.get('key') is None
+    cache.set('key', {'value': 1})
+    assert cache.get('key') == {'value': 1}
+    cache.delete('key')
+    assert cache.get('key') is None
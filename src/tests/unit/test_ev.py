@@ -0,0 +1,74 @@
+import pickle
+import pytest
+from unittest.mock import patch
+
+from ..mock import env_vars
+from talklib.ev import EV, MissingVariablesError
+
+
+@pytest.fixture(autouse=True)
+def restore_ev():
+    yield
+    with patch.dict('os.environ', env_vars):
+        EV.reload()
+
+def load(environ: dict) -> EV:
+    with patch.dict('os.environ', environ, clear=True):
+        return EV.reload()
+
+
+def test_ev_is_shared():
+    with patch.dict('os.environ', env_vars):
+        assert EV() is EV()
+
+def test_ev_is_read_only():
+    ev = load(env_vars)
+    with pytest.raises(AttributeError):
+        ev.mail_server = 'somewhere else'
+    with pytest.raises(AttributeError):
+        ev.something_new = 1
+
+def test_destinations_is_tuple():
+    ev = load(env_vars)
+    assert ev.destinations == ('nothing', 'mocked_value2')
+
+def test_profile_dir():
+    assert load(env_vars).profile_dir is None
+    assert load({**env_vars, 'talklib_profile_dir': 'profiles'}).profile_dir == 'profiles'
+
+def test_missing_variables_all_reported():
+    with pytest.raises(MissingVariablesError) as error:
+        load({'OnAirPC': 'here', 'twilio_sid': 'here'})
+    assert isinstance(error.value, KeyError)  # what EV used to raise
+    assert 'ProductionPC' in error.value.missing
+    assert 'icecast_pass' in error.value.missing
+    assert 'OnAirPC' not in error.value.missing
+    assert len(error.value.missing) == 10
+    assert str(error.value).startswith('These environment variables are not set: ProductionPC')
+
+def test_failed_reload_keeps_previous():
+    before = load(env_vars)
+    with pytest.raises(MissingVariablesError):
+        load({})
+    with patch.dict('os.environ', {}, clear=True):
+        assert EV() is before
+
+def test_config_file(tmp_path):
+    config = tmp_path / 'talklib.toml'
+    config.write_text('\n'.join(f'{key} = "{value}"' for key, value in env_vars.items()))
+    ev = load({'talklib_config': str(config), 'mail_server_external': 'from the environment'})
+    assert ev.twilio_sid == 'mocked_value2'
+    assert ev.mail_server == 'from the environment'  # the environment wins over the file
+
+def test_replace():
+    ev = load(env_vars)
+    other = ev.replace(mail_server='127.0.0.1')
+    assert other.mail_server == '127.0.0.1'
+    assert ev.mail_server == 'mocked_value2'
+    assert EV() is ev
+
+def test_pickle():
+    ev = load(env_vars).replace(syslog_host='127.0.0.1')
+    copy = pickle.loads(pickle.dumps(ev))
+    assert copy.syslog_host == '127.0.0.1'
+    assert copy.destinations == ev.destinations
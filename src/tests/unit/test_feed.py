@@ -0,0 +1,52 @@
+import pytest
+import xml.etree.ElementTree as ET
+
+from talklib.feed import Episode, parse_first_item
+from ..mock import make_feed
+
+
+def test_episode_from_feed():
+    episode = Episode.from_feed(ET.fromstring(make_feed(audio_url='https://somesite.org/today.mp3')))
+    assert episode.title == 'Episode 0'
+    assert episode.url == 'https://somesite.org/today.mp3'
+    assert episode.length == 12345
+    assert episode.type == 'audio/mpeg'
+
+def test_episode_from_feed_without_items():
+    with pytest.raises(ValueError):
+        Episode.from_feed(ET.fromstring('<rss><channel><title>empty</title></channel></rss>'))
+
+def test_episode_from_feed_without_enclosure():
+    with pytest.raises(ValueError):
+        Episode.from_feed(ET.fromstring('<rss><channel><item><title>no audio</title></item></channel></rss>'))
+
+def test_episode_bad_length():
+    '''a missing or garbled length shouldn't stop us'''
+    feed = '<rss><channel><item><enclosure url="https://somesite.org/a.mp3" length="unknown"/></item></channel></rss>'
+    assert Episode.from_feed(ET.fromstring(feed)).length is None
+
+# ---------- parse first item ----------
+
+def chunked(feed: bytes, size: int = 1024):
+    return [feed[start:start + size] for start in range(0, len(feed), size)]
+
+def test_parse_first_item_keeps_only_first_item():
+    root = parse_first_item(chunked(make_feed(items=50)))
+    assert len(root.findall('channel/item')) == 1
+    assert root.findtext('channel/title') == 'Test Feed'
+    assert Episode.from_feed(root).title == 'Episode 0'
+
+def test_parse_first_item_stops_early():
+    '''anything after the first item should never be read'''
+    def stream():
+        yield make_feed(items=1).split(b'</channel>')[0]
+        raise AssertionError('read past the first item')
+    assert Episode.from_feed(parse_first_item(stream())).title == 'Episode 0'
+
+def test_parse_first_item_without_items():
+    root = parse_first_item([b'<rss><channel><title>empty</title></channel></rss>'])
+    assert root.find('channel/item') is None
+
+def test_parse_first_item_not_xml():
+    with pytest.raises(ET.ParseError):
+        parse_first_item([b'<html><body>not a feed'])
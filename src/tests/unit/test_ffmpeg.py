@@ -0,0 +1,325 @@
+import errno
+import ffmpeg
+import os
+import time
+import pytest
+import wave
+
+from talklib import FFMPEG
+from talklib.ffmpeg import OutputCache, parse_analysis, parse_loudnorm
+from unittest.mock import patch
+
+from ..mock import make_audio
+
+output_file = 'delete_me_ffmpeg.wav'
+
+
+def chunked(audio: bytes, size: int = 16 * 1024):
+    return [audio[start:start + size] for start in range(0, len(audio), size)]
+
+def get_seconds(filename: str) -> float:
+    with wave.open(filename) as audio:
+        return audio.getnframes() / audio.getframerate()
+
+@pytest.fixture
+def template_ffmpeg():
+    yield FFMPEG(output_file=output_file)
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+def tone_then_silence(path) -> str:
+    '''3 seconds of tone, then 2 of silence'''
+    tone = ffmpeg.input('sine=frequency=440:duration=3', f='lavfi')
+    silence = ffmpeg.input('anullsrc=r=44100:cl=mono:d=2', f='lavfi')
+    stream = ffmpeg.output(ffmpeg.concat(tone, silence, v=0, a=1), str(path), ac=1, ar=44100)
+    ffmpeg.run(stream, overwrite_output=True, quiet=True)
+    return str(path)
+
+# ----- analysis -----
+
+# trimmed from what ffmpeg 7 prints
+ANALYSIS_OUTPUT = '''
+[silencedetect @ 0x7f019c018a40] silence_start: 3
+[Parsed_ebur128_4 @ 0x7f019c018c80] Summary:
+
+  Integrated loudness:
+    I:         -21.2 LUFS
+    Threshold: -31.3 LUFS
+
+  Loudness range:
+    LRA:         4.2 LU
+    Threshold: -42.7 LUFS
+
+  True peak:
+    Peak:      -17.2 dBFS
+[silencedetect @ 0x7f019c018a40] silence_end: 5 | silence_duration: 2
+[Parsed_astats_2 @ 0x7f019c018600] Channel: 1
+[Parsed_astats_2 @ 0x7f019c018600] Peak level dB: -17.203916
+[Parsed_astats_2 @ 0x7f019c018600] Overall
+[Parsed_astats_2 @ 0x7f019c018600] Peak level dB: -17.203916
+[Parsed_astats_2 @ 0x7f019c018600] RMS level dB: -22.478463
+[Parsed_astats_2 @ 0x7f019c018600] RMS trough dB: -193.931077
+[Parsed_astats_2 @ 0x7f019c018600] Number of samples: 220500
+size=     431KiB time=00:00:05.00 bitrate= 705.7kbits/s speed=20.6x
+'''
+
+def test_parse_analysis():
+    analysis = parse_analysis(ANALYSIS_OUTPUT, sample_rate=44100)
+    assert (analysis.integrated_loudness, analysis.loudness_range, analysis.true_peak) == (-21.2, 4.2, -17.2)
+    assert (analysis.peak_level, analysis.rms_level) == (-17.203916, -22.478463)
+    assert analysis.duration == 5.0
+    assert analysis.silences == [(3.0, 5.0)]
+    assert analysis.silence_seconds == 2.0
+
+def test_parse_analysis_older_ffmpeg():
+    '''no final progress line, and a silence that runs to the end has no silence_end'''
+    output = ANALYSIS_OUTPUT.replace('silence_end: 5 | silence_duration: 2', '').replace('size=', '')
+    output = output.replace('time=', '')
+    analysis = parse_analysis(output, sample_rate=44100)
+    assert analysis.duration == 5.0  # from the number of samples
+    assert analysis.silences == [(3.0, 5.0)]
+
+def test_parse_analysis_nothing():
+    analysis = parse_analysis('', sample_rate=44100)
+    assert analysis.duration is None and analysis.integrated_loudness is None and analysis.silences == []
+
+def test_analysis_off(template_ffmpeg: FFMPEG, tmp_path):
+    template_ffmpeg.input_file = tone_then_silence(tmp_path / 'input.wav')
+    assert 'quiet' in template_ffmpeg.get_commands()
+    template_ffmpeg.convert()
+    assert template_ffmpeg.analysis is None
+
+def test_convert_analyze(template_ffmpeg: FFMPEG, tmp_path):
+    template_ffmpeg.input_file = tone_then_silence(tmp_path / 'input.wav')
+    template_ffmpeg.analyze = True
+    template_ffmpeg.silence_duration = 1
+    assert template_ffmpeg.convert() == output_file
+    analysis = template_ffmpeg.analysis
+    assert analysis.duration == pytest.approx(get_seconds(output_file), abs=0.02)
+    assert analysis.duration == pytest.approx(5, abs=0.05)
+    assert -23 < analysis.integrated_loudness < -19  # loudnorm aims for -21
+    assert analysis.true_peak < 0
+    assert len(analysis.silences) == 1
+    assert analysis.silences[0] == pytest.approx((3, 5), abs=0.05)
+
+def stereo(path) -> str:
+    '''7 seconds of 48 kHz stereo MP3, with different tones left and right. Like most podcasts'''
+    left = ffmpeg.input('sine=frequency=440:duration=7:sample_rate=48000', f='lavfi')
+    right = ffmpeg.input('sine=frequency=660:duration=7:sample_rate=48000', f='lavfi')
+    stream = ffmpeg.output(ffmpeg.filter([left, right], 'amerge', inputs=2), str(path), ac=2, ar=48000)
+    ffmpeg.run(stream, overwrite_output=True, quiet=True)
+    return str(path)
+
+@pytest.mark.parametrize('breakaway', [0, 4])
+def test_convert_analyze_same_output(template_ffmpeg: FFMPEG, tmp_path, breakaway):
+    '''the measuring filters don't change the audio, and they measure the (mono) file we write'''
+    template_ffmpeg.input_file = stereo(tmp_path / 'stereo.mp3')
+    template_ffmpeg.breakaway = breakaway
+    template_ffmpeg.convert()
+    plain = open(output_file, 'rb').read()
+    template_ffmpeg.analyze = True
+    template_ffmpeg.convert()
+    assert open(output_file, 'rb').read() == plain
+    with wave.open(output_file) as converted:
+        assert converted.getnchannels() == 1
+    assert template_ffmpeg.analysis.duration == pytest.approx(breakaway or 7, abs=0.05)
+
+def test_convert_stream_analyze_breakaway(template_ffmpeg: FFMPEG, tmp_path):
+    '''only what was written (up to the breakaway) is measured'''
+    audio = open(tone_then_silence(tmp_path / 'input.wav'), 'rb').read()
+    template_ffmpeg.analyze = True
+    template_ffmpeg.silence_duration = 0.5
+    template_ffmpeg.breakaway = 4
+    template_ffmpeg.convert_stream(chunked(audio))
+    analysis = template_ffmpeg.analysis
+    assert analysis.duration == pytest.approx(4, abs=0.05)
+    assert analysis.silences[0] == pytest.approx((3, 4), abs=0.05)
+
+# ----- two pass -----
+
+LOUDNORM_OUTPUT = '''
+[Parsed_loudnorm_0 @ 0x7f2b2c004f00] 
+{
+	"input_i" : "-22.25",
+	"input_tp" : "-18.06",
+	"input_lra" : "5.30",
+	"input_thresh" : "-32.45",
+	"output_i" : "-21.01",
+	"output_tp" : "-16.92",
+	"output_lra" : "4.20",
+	"output_thresh" : "-31.24",
+	"normalization_type" : "dynamic",
+	"target_offset" : "0.01"
+}
+'''
+
+def test_parse_loudnorm():
+    assert parse_loudnorm(LOUDNORM_OUTPUT) == {'input_i': -22.25, 'input_tp': -18.06, 'input_lra': 5.3,
+                                               'input_thresh': -32.45, 'target_offset': 0.01}
+
+def test_parse_loudnorm_unusable():
+    assert parse_loudnorm('') is None
+    assert parse_loudnorm(LOUDNORM_OUTPUT.replace('"-22.25"', '"-inf"')) is None  # silence
+    assert parse_loudnorm('{"input_i": "-22"}') is None
+
+def test_two_pass(template_ffmpeg: FFMPEG, tmp_path):
+    template_ffmpeg.input_file = tone_then_silence(tmp_path / 'input.wav')
+    template_ffmpeg.two_pass = True
+    template_ffmpeg.convert()
+    assert -30 < template_ffmpeg.measurement['input_i'] < -10
+    assert not template_ffmpeg.measurement_cached
+    command = ' '.join(template_ffmpeg.get_commands())
+    assert f"measured_I={template_ffmpeg.measurement['input_i']}" in command and 'linear=true' in command
+    assert 2.9 < get_seconds(output_file) < 5.1
+
+def test_two_pass_cache(template_ffmpeg: FFMPEG, tmp_path):
+    '''the second time, the first pass is skipped'''
+    template_ffmpeg.input_file = tone_then_silence(tmp_path / 'input.wav')
+    template_ffmpeg.two_pass = True
+    template_ffmpeg.cache_dir = str(tmp_path / 'cache')
+    template_ffmpeg.convert()
+    measured = template_ffmpeg.measurement
+    with patch('talklib.ffmpeg.parse_loudnorm', side_effect=AssertionError('should not measure again')):
+        template_ffmpeg.convert()
+    assert template_ffmpeg.measurement_cached
+    assert template_ffmpeg.measurement == measured
+
+    template_ffmpeg.compression_level = 18  # a different target needs its own measurement
+    template_ffmpeg.measure_loudness()
+    assert not template_ffmpeg.measurement_cached
+
+def test_two_pass_silence(template_ffmpeg: FFMPEG, tmp_path):
+    '''nothing to measure, so it falls back to one pass'''
+    stream = ffmpeg.output(ffmpeg.input('anullsrc=r=44100:cl=mono:d=1', f='lavfi'), str(tmp_path / 'silence.wav'))
+    ffmpeg.run(stream, quiet=True)
+    template_ffmpeg.input_file = str(tmp_path / 'silence.wav')
+    template_ffmpeg.two_pass = True
+    template_ffmpeg.convert()
+    assert template_ffmpeg.measurement is None
+    assert 'linear=true' not in ' '.join(template_ffmpeg.get_commands())
+
+# ----- output cache -----
+
+def test_output_cache(template_ffmpeg: FFMPEG, tmp_path):
+    template_ffmpeg.input_file = tone_then_silence(tmp_path / 'input.wav')
+    template_ffmpeg.cache_dir = str(tmp_path / 'cache')
+    template_ffmpeg.output_cache = True
+    template_ffmpeg.analyze = True
+    template_ffmpeg.silence_duration = 1
+    template_ffmpeg.convert()
+    converted = open(output_file, 'rb').read()
+    analysis = template_ffmpeg.analysis
+    assert not template_ffmpeg.output_cached
+    os.remove(output_file)
+
+    with patch('talklib.ffmpeg.ffmpeg.run', side_effect=AssertionError('should not run ffmpeg')):
+        assert template_ffmpeg.convert() == output_file
+    assert template_ffmpeg.output_cached
+    assert open(output_file, 'rb').read() == converted
+    assert template_ffmpeg.analysis == analysis
+    cache = template_ffmpeg.get_output_cache()
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_output_cache_key(template_ffmpeg: FFMPEG, tmp_path):
+    '''different settings or different audio need their own entry. Where the files are doesn't matter'''
+    template_ffmpeg.input_file = tone_then_silence(tmp_path / 'input.wav')
+    template_ffmpeg.cache_dir = str(tmp_path / 'cache')
+    template_ffmpeg.output_cache = True
+    template_ffmpeg.convert()
+    template_ffmpeg.compression_level = 18
+    template_ffmpeg.convert()
+    assert not template_ffmpeg.output_cached
+
+    os.rename(tmp_path / 'input.wav', tmp_path / 'moved.wav')
+    template_ffmpeg.input_file = str(tmp_path / 'moved.wav')
+    template_ffmpeg.convert()
+    assert template_ffmpeg.output_cached
+
+    with open(tmp_path / 'moved.wav', 'ab') as file:
+        file.write(b'\x00\x00' * 100)
+    template_ffmpeg.convert()
+    assert not template_ffmpeg.output_cached
+
+def add_entry(cache: OutputCache, source, key: str, used: float):
+    cache.set(key=key, extension='.wav', output_file=str(source), details={})
+    os.utime(os.path.join(cache.directory, f'{key}.wav'), (used, used))
+
+def test_output_cache_evicts_least_recently_used(tmp_path):
+    source = tmp_path / 'source.wav'
+    source.write_bytes(b'x' * 1000)
+    cache = OutputCache(directory=str(tmp_path / 'cache'), max_bytes=2500, max_age=3600)
+    now = time.time()
+    add_entry(cache, source, 'a', used=now - 30)
+    add_entry(cache, source, 'b', used=now - 20)
+    cache.get(key='a', extension='.wav', output_file=str(tmp_path / 'out.wav'))  # a is now the most recently used
+    add_entry(cache, source, 'c', used=now)
+    assert sorted(os.listdir(cache.directory)) == ['a.wav', 'c.wav', 'details']
+    assert cache.get(key='b', extension='.wav', output_file=str(tmp_path / 'out.wav')) is None
+    assert len(os.listdir(os.path.join(cache.directory, 'details'))) == 2  # b's details went with it
+    assert cache.evictions == 1
+
+def test_output_cache_evicts_old(tmp_path):
+    source = tmp_path / 'source.wav'
+    source.write_bytes(b'x' * 10)
+    cache = OutputCache(directory=str(tmp_path / 'cache'), max_bytes=10 ** 6, max_age=3600)
+    add_entry(cache, source, 'old', used=time.time() - 7200)
+    add_entry(cache, source, 'new', used=time.time())  # adding an entry evicts the old one
+    assert cache.evictions == 1
+    assert cache.evict() == 0
+    assert cache.get(key='old', extension='.wav', output_file=str(tmp_path / 'out.wav')) is None
+    assert cache.get(key='new', extension='.wav', output_file=str(tmp_path / 'out.wav')) == {}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+# ----- convert stream -----
+
+def test_convert_stream(template_ffmpeg: FFMPEG):
+    assert template_ffmpeg.convert_stream(chunked(make_audio(seconds=3))) == output_file
+    assert 2.9 < get_seconds(output_file) < 3.1
+    assert not template_ffmpeg.stopped_early
+
+def test_convert_stream_stops_at_breakaway(template_ffmpeg: FFMPEG):
+    '''once ffmpeg has breakaway seconds of audio, the rest of the input should never be read'''
+    chunks = chunked(make_audio(seconds=120))
+    consumed = []
+    def stream():
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+    template_ffmpeg.breakaway = 5
+    template_ffmpeg.convert_stream(stream())
+    assert template_ffmpeg.stopped_early
+    assert len(consumed) < len(chunks) / 4
+    assert 4.9 < get_seconds(output_file) < 5.1
+
+class WindowsPipe:
+    '''on Windows, writing to or closing a pipe nobody is reading raises EINVAL, not BrokenPipeError'''
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    def write(self, data):
+        try:
+            return self.pipe.write(data)
+        except BrokenPipeError:
+            raise OSError(errno.EINVAL, 'Invalid argument')
+
+    def close(self):
+        try:
+            self.pipe.close()
+        except BrokenPipeError:
+            raise OSError(errno.EINVAL, 'Invalid argument')
+
+def test_convert_stream_stops_at_breakaway_windows(template_ffmpeg: FFMPEG):
+    run_async = ffmpeg.run_async
+    def windows_run_async(*args, **kwargs):
+        process = run_async(*args, **kwargs)
+        process.stdin = WindowsPipe(process.stdin)
+        return process
+    template_ffmpeg.breakaway = 5
+    with patch('talklib.ffmpeg.ffmpeg.run_async', windows_run_async):
+        template_ffmpeg.convert_stream(chunked(make_audio(seconds=120)))
+    assert template_ffmpeg.stopped_early
+    assert 4.9 < get_seconds(output_file) < 5.1
+
+def test_convert_stream_not_audio(template_ffmpeg: FFMPEG):
+    with pytest.raises(Exception):
+        template_ffmpeg.convert_stream([b'<html>not audio</html>'] * 100)
@@ -0,0 +1,47 @@
+'''
+Cold start: what `import talklib` (and the modules a show script needs) pulls in.
+Every show script pays for it before it does anything, so the slow, rarely needed
+modules should stay out until they're used. Timings vary too much from machine to
+machine to test; what gets imported doesn't.
+'''
+
+import os
+import subprocess
+import sys
+
+import talklib
+
+# modules most scripts don't need: slow to import, or (the profilers) only wanted when profiling is on
+HEAVY = ('twilio', 'aiohttp', 'smtplib', 'cProfile', 'tracemalloc')
+
+
+def import_times(statement: str) -> dict:
+    '''run statement in a fresh interpreter with -X importtime. Returns {module: cumulative microseconds}'''
+    source = os.path.dirname(os.path.dirname(talklib.__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=source, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+def heavy_modules(times: dict) -> list:
+    return [module for module in times if module.split('.')[0] in HEAVY]
+
+
+def test_import_talklib_is_lazy():
+    times = import_times('import talklib')
+    assert 'talklib' in times
+    assert not [module for module in times if module.startswith('talklib.')]
+    assert heavy_modules(times) == []
+
+def test_show_defers_heavy_imports():
+    times = import_times('import talklib.show')
+    assert heavy_modules(times) == []
+
+def test_lazy_attributes():
+    assert talklib.TLShow.__module__ == 'talklib.show'
+    assert 'FeedPoller' in dir(talklib)
@@ -1,10 +1,13 @@
 from datetime import datetime
+import pstats
 import pytest
 import os
 from unittest.mock import patch, MagicMock
 
 from talklib import TLShow
-from ..mock import env_vars
+from talklib.errors import InvalidAttributeError, SourceFileNotFoundError
+from talklib.show import RunResult
+from ..mock import env_vars, make_audio
 
 url = 'http://www.newsservice.org/LatestNC.php?ncd=MzksMzcwLDE='
 cwd = os.getcwd()
@@ -87,4 +90,125 @@ def test_attrib_4a(template_local: TLShow):
 def test_attrib_4b(template_local: TLShow):
     template_local.is_local = 'break'
     with pytest.raises(Exception):
-        template_local.__check_attributes_are_valid()
\ No newline at end of file
+        template_local.__check_attributes_are_valid()
+
+# ---------- headless ----------
+
+def test_headless_raises_without_waiting(template_local: TLShow):
+    '''nobody is there to press enter, so we should never ask'''
+    template_local.headless = True
+    template_local.show = None
+    with patch('builtins.input', side_effect=AssertionError('should not prompt')):
+        with pytest.raises(InvalidAttributeError):
+            template_local.run()
+
+def test_headless_missing_file(template_local: TLShow, tmp_path):
+    template_local.headless = True
+    template_local.local_file = str(tmp_path / 'not_here.mp3')
+    with pytest.raises(SourceFileNotFoundError):
+        template_local.run()
+
+@pytest.fixture
+def runnable_local(template_local: TLShow, tmp_path, monkeypatch) -> TLShow:
+    '''a local show that can actually run: a 2 second source.mp3, one destination (tmp_path/dest), nobody at the screen'''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'source.mp3').write_bytes(make_audio(seconds=2))
+    (tmp_path / 'dest').mkdir()
+    template_local.local_file = 'source.mp3'
+    template_local.destinations = [str(tmp_path / 'dest')]
+    template_local.headless = True
+    template_local.cache_dir = str(tmp_path / 'cache')
+    return template_local
+
+def test_headless_run(runnable_local: TLShow, tmp_path):
+    '''a successful run returns what it did, without clearing the screen or counting down'''
+    (tmp_path / 'dest2').mkdir()
+    runnable_local.destinations.append(str(tmp_path / 'dest2'))
+    with patch('talklib.show.clear_screen', side_effect=AssertionError('should not clear the screen')), \
+         patch('talklib.show.time.sleep', side_effect=AssertionError('should not count down')):
+        result = runnable_local.run()
+    assert isinstance(result, RunResult)
+    assert result.output_file == 'delete_me.wav'
+    assert [transfer.succeeded for transfer in result.transfers] == [True, True]
+    assert (tmp_path / 'dest2' / 'delete_me.wav').exists()
+
+def test_run_record(runnable_local: TLShow, tmp_path):
+    '''every run (including a failed one) is timed stage by stage and handed to the hooks and outputs'''
+    runnable_local.metrics_jsonl = str(tmp_path / 'runs.jsonl')
+    runnable_local.metrics_textfile_dir = str(tmp_path)
+    hooked = []
+    runnable_local.run_hooks.append(hooked.append)
+
+    result = runnable_local.run()
+    assert hooked == [result.record] and runnable_local.last_run is result.record
+    assert [stage.name for stage in result.record.stages] == ['convert', 'check_length', 'copy', 'verify']
+    convert, _, copy, _ = result.record.stages
+    assert convert.bytes == copy.bytes == os.path.getsize(tmp_path / 'dest' / 'delete_me.wav')
+    assert (tmp_path / 'talklib_delete_me.prom').exists()
+
+    runnable_local.local_file = 'not_here.mp3'
+    with pytest.raises(FileNotFoundError):
+        runnable_local.run()
+    assert not hooked[1].succeeded
+    assert len((tmp_path / 'runs.jsonl').read_text().splitlines()) == 2
+
+def test_profile(runnable_local: TLShow, tmp_path):
+    '''each stage gets its own cProfile and memory report'''
+    runnable_local.profile_dir = str(tmp_path / 'profiles')
+    runnable_local.run()
+
+    names = sorted(file.name for file in (tmp_path / 'profiles').iterdir())
+    assert len(names) == 8  # convert, check_length, copy and verify
+    assert names[0].startswith('delete_me-') and names[0].endswith('-01-convert-memory.txt')
+    convert = next(tmp_path.glob('profiles/*-01-convert.pstats'))
+    assert pstats.Stats(str(convert)).total_calls > 0
+    assert 'peak' in next(tmp_path.glob('profiles/*-03-copy-memory.txt')).read_text()
+
+def test_profile_dir_unusable(runnable_local: TLShow, tmp_path):
+    '''a profile folder we can't make doesn't stop the show'''
+    (tmp_path / 'not_a_folder').write_text('')
+    runnable_local.profile_dir = str(tmp_path / 'not_a_folder' / 'profiles')
+    assert runnable_local.run().transfers[0].succeeded
+
+def test_check_length_reads_wav_header(template_local: TLShow, tmp_path):
+    '''the WAV files we make say how long they are, so there is no need for ffprobe'''
+    path = tmp_path / 'delete_me.wav'
+    path.write_bytes(make_audio(seconds=30, format='wav'))
+    template_local.check_if_above = 1
+    template_local.check_if_below = .1
+    with patch('talklib.show.FFMPEG.get_length_in_minutes', side_effect=AssertionError('should not run ffprobe')):
+        assert template_local._TLShow__check_length(fileToCheck=str(path)) == 0.5
+
+def test_analyze_audio(runnable_local: TLShow):
+    pytest.importorskip('numpy')
+    runnable_local.analyze_audio = True
+    result = runnable_local.run()
+    assert result.audio.duration == pytest.approx(2, abs=0.1)
+    assert -40 < result.audio.rms_dbfs < 0
+    assert 'analyze' in [stage.name for stage in result.record.stages]
+
+def test_conversion_analysis(runnable_local: TLShow):
+    '''with ffmpeg.analyze on, the length check uses what ffmpeg measured and nothing reads the file again'''
+    runnable_local.check_if_above = 1
+    runnable_local.check_if_below = .01
+    runnable_local.ffmpeg.analyze = True
+    with patch('talklib.show.read_header', side_effect=AssertionError('should not read the header')):
+        with patch('talklib.show.FFMPEG.get_length_in_minutes', side_effect=AssertionError('should not run ffprobe')):
+            result = runnable_local.run()
+    assert result.conversion.duration == pytest.approx(2, abs=0.05)
+    assert result.conversion.integrated_loudness is not None
+
+def test_two_pass_uses_cache_dir(runnable_local: TLShow, tmp_path):
+    runnable_local.ffmpeg.two_pass = True
+    runnable_local.run()
+    assert runnable_local.ffmpeg.cache_dir == str(tmp_path / 'cache')
+    assert os.listdir(tmp_path / 'cache' / 'loudnorm')
+
+def test_rerun_uses_output_cache(runnable_local: TLShow):
+    runnable_local.ffmpeg.output_cache = True
+    first = runnable_local.run()
+    assert not runnable_local.ffmpeg.output_cached
+    with patch('talklib.ffmpeg.ffmpeg.run', side_effect=AssertionError('should not run ffmpeg')):
+        second = runnable_local.run()
+    assert runnable_local.ffmpeg.output_cached
+    assert second.transfers[0].digest == first.transfers[0].digest
@@ -0,0 +1,59 @@
+import json
+import time
+import pytest
+
+from talklib.metrics import RunRecorder, append_jsonl, to_prometheus, write_textfile
+
+
+def make_record():
+    recorder = RunRecorder(show='Delete "Me"')
+    with recorder.stage('download'):
+        recorder.add_bytes(1000)
+        with recorder.stage('notify'):
+            time.sleep(0.05)
+        recorder.add_bytes(24)  # back to the download once the notification is done
+    with pytest.raises(ValueError):
+        with recorder.stage('convert'):
+            raise ValueError('not audio')
+    return recorder.finish(error=ValueError('not audio'))
+
+
+def test_stages():
+    record = make_record()
+    assert [stage.name for stage in record.stages] == ['download', 'notify', 'convert']
+    download, notify, convert = record.stages
+    assert download.bytes == 1024 and download.succeeded
+    assert notify.bytes is None
+    assert download.seconds >= notify.seconds >= 0.05
+    assert not convert.succeeded and convert.error == 'not audio'
+    assert not record.succeeded and record.error == 'not audio'
+    assert record.seconds >= download.seconds
+
+def test_stage_seconds_adds_up_repeats():
+    recorder = RunRecorder(show='test')
+    for _ in range(2):
+        with recorder.stage('notify'):
+            time.sleep(0.02)
+    assert recorder.finish().stage_seconds()['notify'] >= 0.04
+
+def test_jsonl(tmp_path):
+    path = tmp_path / 'runs.jsonl'
+    append_jsonl(record=make_record(), path=str(path))
+    append_jsonl(record=make_record(), path=str(path))
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    run = json.loads(lines[0])
+    assert run['show'] == 'Delete "Me"'
+    assert run['stages'][0]['bytes'] == 1024
+
+def test_prometheus():
+    text = to_prometheus(make_record())
+    assert 'talklib_run_success{show="Delete \\"Me\\""} 0' in text
+    assert 'talklib_stage_bytes{show="Delete \\"Me\\"",stage="download"} 1024' in text
+    assert 'stage="convert"' in text
+    assert text.endswith('\n')
+
+def test_textfile(tmp_path):
+    path = write_textfile(record=make_record(), directory=str(tmp_path), name='delete_me')
+    assert path == str(tmp_path / 'talklib_delete_me.prom')
+    assert [file.name for file in tmp_path.iterdir()] == ['talklib_delete_me.prom']  # no temporary file left behind
@@ -133,9 +133,9 @@ def test_convert_2(template_local: TLShow):
     assert template_local._TLShow__convert(input=download_test_file()) == f'{template_local.show_filename}.wav'
     os.remove(f'{template_local.show_filename}.wav') # actually converts the file so need to remove it
 
-def test_convert_4(template_permalink: TLShow):
+def test_convert_4(template_permalink: TLShow, tmp_path):
     '''assert an exception is raised when ffmpeg tries to convert a non-audio file'''
-    with open('test.mp3', mode='wb') as test_file:
+    with open(tmp_path / 'test.mp3', mode='wb') as test_file:
             a = requests.get('https://library.nashville.org/themes/custom/npl/logo.svg') #not an audio file
             test_file.write(a.content)
     with pytest.raises(Exception):
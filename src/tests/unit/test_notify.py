@@ -0,0 +1,316 @@
+from concurrent.futures import Future
+import json
+import smtplib
+import socket
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from ..mock import env_vars, LocalServer, LocalSMTPServer
+with patch.dict('os.environ', env_vars):
+    from talklib import notify, registry
+    from talklib.notify import Notify, Syslog
+
+
+def make_syslog(port: int, protocol: str = 'udp') -> Syslog:
+    with patch.dict('os.environ', env_vars):
+        syslog = Syslog()
+    syslog.syslog_host = '127.0.0.1'
+    syslog.syslog_port = port
+    syslog.syslog_protocol = protocol
+    return syslog
+
+# ----- syslog -----
+
+def test_syslog_udp():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(5)
+    syslog = make_syslog(port=server.getsockname()[1])
+    syslog.send_syslog_message(message='hello', level='warning')
+    syslog.send_syslog_message(message='again')
+    syslog.flush()
+    assert server.recv(1024) == b'<12>hello\x00'  # user facility, warning
+    assert server.recv(1024) == b'<14>again\x00'  # user facility, info
+    server.close()
+
+@pytest.mark.skipif(not socket.has_ipv6, reason='no IPv6')
+def test_syslog_udp_ipv6():
+    server = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    try:
+        server.bind(('::1', 0))
+    except OSError:
+        pytest.skip('no IPv6 loopback')
+    server.settimeout(5)
+    syslog = make_syslog(port=server.getsockname()[1])
+    syslog.syslog_host = '::1'
+    syslog.send_syslog_message(message='hello')
+    syslog.flush()
+    assert server.recv(1024) == b'<14>hello\x00'
+    server.close()
+
+def test_syslog_tcp_uses_one_connection():
+    server = socket.create_server(('127.0.0.1', 0))
+    server.settimeout(5)
+    syslog = make_syslog(port=server.getsockname()[1], protocol='tcp')
+    for number in range(20):
+        syslog.send_syslog_message(message=f'message {number}')
+    syslog.flush()
+    connection, _ = server.accept()
+    received = b''
+    while data := connection.recv(65536):
+        received = received + data
+    assert received.count(b'\x00') == 20
+    assert b'<14>message 19\x00' in received
+    server.settimeout(0.1)
+    with pytest.raises(socket.timeout):
+        server.accept()  # only one connection for all 20 messages
+    connection.close()
+    server.close()
+
+def test_syslog_does_not_block():
+    '''a syslog server that is slow (or gone) should never hold up the caller'''
+    release = threading.Event()
+    with patch.object(notify._BatchingSysLogHandler, 'emit_batch', lambda self, records: release.wait(5)):
+        syslog = make_syslog(port=9)
+        syslog.queue_size = 5
+        start = time.monotonic()
+        for number in range(100):
+            syslog.send_syslog_message(message=f'message {number}')
+        assert time.monotonic() - start < 0.5
+        assert syslog.dropped > 0
+        release.set()
+        syslog.flush()
+
+def test_syslog_bad_protocol():
+    syslog = make_syslog(port=9, protocol='carrier pigeon')
+    with pytest.raises(ValueError):
+        syslog.send_syslog_message(message='hello')
+
+# ----- email -----
+
+@pytest.fixture
+def template_notify():
+    with patch.dict('os.environ', env_vars):
+        test = Notify()
+    yield test
+    registry.close_all()  # fresh connections, breakers and digests for the next test
+
+def test_send_mail_reuses_connection(template_notify: Notify):
+    with LocalSMTPServer() as server:
+        with patch.object(template_notify, 'EV', template_notify.EV.replace(mail_server=server.host)):
+            for number in range(3):
+                template_notify.send_mail(message=f'message {number}', subject='Test')
+            with patch.dict('os.environ', env_vars):
+                another = Notify()  # shared across instances, too
+            with patch.object(another, 'EV', another.EV.replace(mail_server=server.host)):
+                another.send_mail(message='from another instance', subject='Test')
+    assert server.connections == 1
+    assert len(server.messages) == 4
+    assert b'Subject: Test' in server.messages[0]
+
+def test_send_mail_checks_idle_connection(template_notify: Notify):
+    with LocalSMTPServer() as server:
+        with patch.object(template_notify, 'EV', template_notify.EV.replace(mail_server=server.host)):
+            template_notify.send_mail(message='first', subject='Test')
+            notify._get_smtp_session(host=server.host, timeout=30).last_used = 0  # pretend it's been idle a while
+            template_notify.send_mail(message='second', subject='Test')
+    assert 'NOOP' in server.commands
+    assert server.connections == 1
+
+def test_send_mail_reconnects(template_notify: Notify):
+    with LocalSMTPServer() as server:
+        with patch.object(template_notify, 'EV', template_notify.EV.replace(mail_server=server.host)):
+            template_notify.send_mail(message='first', subject='Test')
+            notify._get_smtp_session(host=server.host, timeout=30).connection.close()  # connection drops
+            template_notify.send_mail(message='second', subject='Test')
+    assert server.connections == 2
+    assert len(server.messages) == 2
+
+def test_send_mail_no_resend_on_smtp_error(template_notify: Notify):
+    '''a refused recipient is an answer, not a dropped connection. don't try again'''
+    with LocalSMTPServer(replies={'RCPT': '550 no such user'}) as server:
+        with patch.object(template_notify, 'EV', template_notify.EV.replace(mail_server=server.host)):
+            with pytest.raises(smtplib.SMTPRecipientsRefused):
+                template_notify.send_mail(message='first', subject='Test')
+    assert server.commands.count('MAIL') == 1
+    assert server.connections == 1
+
+def test_send_mail_no_resend_after_hand_off(template_notify: Notify):
+    '''the server has the message but hung up before saying so. a resend could deliver it twice'''
+    with LocalSMTPServer(replies={'.': None}) as server:
+        with patch.object(template_notify, 'EV', template_notify.EV.replace(mail_server=server.host)):
+            with pytest.raises(smtplib.SMTPServerDisconnected):
+                template_notify.send_mail(message='first', subject='Test')
+            assert notify._get_smtp_session(host=server.host, timeout=30).connection is None
+    assert len(server.messages) == 1
+    assert server.connections == 1
+
+# ----- twilio -----
+
+def slow_twilio(handler):
+    '''stand-in for the Twilio API: takes its time, then says the message/call was created'''
+    time.sleep(0.5)
+    return 201, {'Content-Type': 'application/json'}, json.dumps({'sid': 'SM123'}).encode()
+
+@pytest.fixture
+def twilio_server():
+    sid = env_vars['twilio_sid']
+    routes = {f'/2010-04-01/Accounts/{sid}/Messages.json': (201, {}, slow_twilio),
+              f'/2010-04-01/Accounts/{sid}/Calls.json': (201, {}, slow_twilio)}
+    with LocalServer(routes=routes) as server:
+        yield server
+
+def test_send_sms_in_background(template_notify: Notify, twilio_server: LocalServer):
+    '''sending an SMS should return immediately, not wait for Twilio'''
+    template_notify.twilio_api_url = twilio_server.url
+    start = time.monotonic()
+    future = template_notify.send_sms(message='hello')
+    assert time.monotonic() - start < 0.3
+    assert isinstance(future, Future)
+    assert future.result(timeout=5) == 'SM123'
+    assert b'Body=hello' in twilio_server.bodies[0]
+
+def test_send_call_and_wait(template_notify: Notify, twilio_server: LocalServer):
+    template_notify.twilio_api_url = twilio_server.url
+    template_notify.twilio_background = False
+    assert template_notify.send_call(message='hello') == 'SM123'
+    assert twilio_server.requests[0][0] == 'POST'
+
+def test_twilio_client_is_reused(template_notify: Notify, twilio_server: LocalServer):
+    template_notify.twilio_api_url = twilio_server.url
+    template_notify.twilio_background = False
+    import twilio.rest
+    registry.close_all()  # so no client is left over from an earlier test
+    with patch.object(twilio.rest, 'Client', wraps=twilio.rest.Client) as client:
+        template_notify.send_sms(message='one')
+        template_notify.send_sms(message='two')
+    assert client.call_count == 1
+
+def test_twilio_timeout(template_notify: Notify, twilio_server: LocalServer):
+    template_notify.twilio_api_url = twilio_server.url
+    template_notify.twilio_timeout = 0.1
+    with pytest.raises(Exception):
+        template_notify.send_sms(message='hello').result(timeout=5)
+
+# ----- sending over every channel -----
+
+def test_send_all_is_concurrent(template_notify: Notify):
+    '''three channels that take 0.5 seconds each should take 0.5 seconds, not 1.5'''
+    start = time.monotonic()
+    results = template_notify.send_all(sends={channel: lambda: time.sleep(0.5) for channel in ('sms', 'mail', 'syslog')})
+    assert time.monotonic() - start < 1.2
+    assert [result.channel for result in results] == ['sms', 'mail', 'syslog']
+    assert all(result.succeeded for result in results)
+
+def test_send_all_deadline(template_notify: Notify):
+    '''a channel that hangs is given up on at its deadline, without holding up the others'''
+    template_notify.channel_deadlines = {'mail': 0.2, 'syslog': 5}
+    release = threading.Event()
+    sent = []
+    start = time.monotonic()
+    mail, syslog = template_notify.send_all(sends={'mail': lambda: release.wait(5), 'syslog': lambda: sent.append('syslog')})
+    assert time.monotonic() - start < 1
+    release.set()
+    assert isinstance(mail.error, TimeoutError)
+    assert syslog.succeeded and sent == ['syslog']
+
+def test_send_all_hung_channel_concurrent_callers(template_notify: Notify):
+    '''
+    many shows at once, with the mail server hung: syslog still goes out for every one of them,
+    mail sends that never got a worker are cancelled, and only the ones that ran count against the breaker
+    '''
+    template_notify.channel_deadlines = {'mail': 0.3, 'syslog': 1}
+    template_notify.breaker_threshold = 100
+    release = threading.Event()
+    started = []
+    def hang():
+        started.append(1)
+        release.wait(5)
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(template_notify.send_all(sends={'mail': hang, 'syslog': lambda: None})))
+               for _ in range(10)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    release.set()
+    time.sleep(0.2)  # cancelled sends would have started by now if they were going to
+    assert len(results) == 10
+    assert all(syslog.succeeded for mail, syslog in results)
+    assert all(isinstance(mail.error, TimeoutError) for mail, syslog in results)
+    workers = notify._get_notify_executor('mail')._max_workers
+    assert len(started) == workers  # the rest never ran
+    assert notify._get_breaker(channel='mail', threshold=100, reset_after=300).failures == workers
+
+def test_send_all_reports_errors(template_notify: Notify):
+    def fail():
+        raise ConnectionRefusedError('no mail server')
+    mail, syslog = template_notify.send_all(sends={'mail': fail, 'syslog': lambda: None})
+    assert isinstance(mail.error, ConnectionRefusedError)
+    assert syslog.succeeded
+
+def test_send_all_waits_on_background_sms(template_notify: Notify):
+    '''send_sms hands back a Future in the background. A failure there still counts'''
+    future = Future()
+    future.set_exception(ConnectionError('twilio is down'))
+    sms, = template_notify.send_all(sends={'sms': lambda: future})
+    assert isinstance(sms.error, ConnectionError)
+
+def test_circuit_breaker(template_notify: Notify):
+    '''after breaker_threshold failures in a row a channel is skipped, until breaker_reset has passed'''
+    template_notify.breaker_threshold = 2
+    template_notify.breaker_reset = 0.3
+    attempts = []
+    def fail():
+        attempts.append(1)
+        raise ConnectionRefusedError
+    for _ in range(4):
+        mail, = template_notify.send_all(sends={'mail': fail})
+    assert len(attempts) == 2
+    assert mail.skipped and not mail.succeeded
+    time.sleep(0.3)
+    mail, = template_notify.send_all(sends={'mail': lambda: None})  # one trial attempt, which works
+    assert mail.succeeded
+    mail, = template_notify.send_all(sends={'mail': fail})
+    assert not mail.skipped and len(attempts) == 3
+
+# ----- coalescing repeats -----
+
+def test_coalesce_mail(template_notify: Notify):
+    '''the same alert from many shows should be one email now and one digest later, not one each'''
+    template_notify.coalesce_window = 0.5
+    with LocalSMTPServer() as server:
+        with patch.object(template_notify, 'EV', template_notify.EV.replace(mail_server=server.host)):
+            for number in range(4):
+                template_notify.send_mail(message=f'Unable to copy show{number}.wav: the share is down', subject=f'Error: show{number}',
+                                          cause='Unable to copy: the share is down')
+            template_notify.send_mail(message='something else went wrong', subject='Error: show5')
+            assert len(server.messages) == 2
+            time.sleep(1)
+            assert len(server.messages) == 3
+    digest = server.messages[2]
+    assert b'Subject: Digest: 3 more alert(s) about the same problem, from 4 show(s)' in digest
+    assert b'show0' not in digest  # the first alert already went out. the digest isn't about that show
+    assert b'3 more alert(s)' in digest
+    assert b'show3.wav' in digest
+    assert notify._get_coalescer().suppressed == 3
+
+def test_coalesce_sms_flush(template_notify: Notify, twilio_server: LocalServer):
+    '''pending digests can be sent right away (Python does this on exit, too)'''
+    template_notify.twilio_api_url = twilio_server.url
+    template_notify.twilio_background = False
+    template_notify.coalesce_window = 60
+    assert template_notify.send_sms(message='destination 1 is down') == 'SM123'
+    assert template_notify.send_sms(message='destination 2 is down') is None  # only the number differs
+    template_notify.flush_digests()
+    assert len(twilio_server.bodies) == 2
+    assert b'1+more+alert' in twilio_server.bodies[1]
+
+def test_no_coalescing_by_default(template_notify: Notify):
+    with LocalSMTPServer() as server:
+        with patch.object(template_notify, 'EV', template_notify.EV.replace(mail_server=server.host)):
+            for _ in range(3):
+                template_notify.send_mail(message='the same thing', subject='Error')
+            assert len(server.messages) == 3
@@ -1,8 +1,10 @@
+import os
 import pytest
+import wave
 from unittest.mock import patch, MagicMock
 
 from talklib import TLShow
-from ..mock import env_vars
+from ..mock import env_vars, LocalServer, make_audio
 
 
 url = 'http://www.newsservice.org/LatestNC.php?ncd=MzksMzcwLDE='
@@ -81,4 +83,97 @@ def test_attrib_4b(template_permalink: TLShow):
 def test_attrib_4c(template_permalink: TLShow):
     template_permalink.is_permalink = 'not boolean'
     with pytest.raises(Exception):
-        template_permalink.__check_attributes_are_valid()
\ No newline at end of file
+        template_permalink.__check_attributes_are_valid()
+
+# ---------- download ----------
+
+audio = os.urandom(300_000)
+
+def test_download_file_streams_in_chunks(template_permalink: TLShow):
+    with LocalServer(routes={'/audio.mp3': (200, {}, audio)}) as server:
+        template_permalink.url = f'{server.url}/audio.mp3'
+        template_permalink.download_chunk_size = 1024
+        downloaded = template_permalink._TLShow__download_file()
+    with open(downloaded, 'rb') as file:
+        assert file.read() == audio
+    os.remove(downloaded)
+
+def test_download_file_incomplete(template_permalink: TLShow):
+    '''an exception should be raised, and the partial file removed, if we get fewer bytes than Content-Length'''
+    with LocalServer(routes={'/audio.mp3': (200, {'Content-Length': str(len(audio) + 10)}, audio)}) as server:
+        template_permalink.url = f'{server.url}/audio.mp3'
+        template_permalink.download_timeout = (1, 1)
+        with pytest.raises(Exception):
+            template_permalink._TLShow__download_file()
+    assert not os.path.exists(f'{template_permalink.show_filename}-input.mp3')
+
+
+# ---------- stream convert ----------
+
+def test_download_and_convert(template_permalink: TLShow):
+    '''the download should be converted without saving the source to disk'''
+    with LocalServer(routes={'/audio.mp3': (200, {}, make_audio(seconds=3))}) as server:
+        template_permalink.url = f'{server.url}/audio.mp3'
+        template_permalink.stream_convert = True
+        output_file = template_permalink._TLShow__get_output_file_from_URL()
+    assert output_file == f'{template_permalink.show_filename}.wav'
+    assert not os.path.exists(f'{template_permalink.show_filename}-input.mp3')
+    with wave.open(output_file) as converted:
+        assert 2.9 < converted.getnframes() / converted.getframerate() < 3.1
+    os.remove(output_file)
+
+def test_download_and_convert_not_audio(template_permalink: TLShow):
+    with LocalServer(routes={'/audio.mp3': (200, {}, b'<html>not audio</html>' * 100)}) as server:
+        template_permalink.url = f'{server.url}/audio.mp3'
+        template_permalink.stream_convert = True
+        with pytest.raises(Exception):
+            with patch('builtins.input', return_value='y'):
+                template_permalink._TLShow__get_output_file_from_URL()
+    assert not os.path.exists(f'{template_permalink.show_filename}.wav')
+
+
+# ---------- skip unchanged ----------
+
+def run_permalink(show: TLShow, server: LocalServer, tmp_path):
+    show.url = f'{server.url}/audio.mp3'
+    show.destinations = [str(tmp_path / 'dest')]
+    show.cache_dir = str(tmp_path / 'cache')
+    show.headless = True
+    show.skip_unchanged = True
+    return show.run()
+
+def test_skip_unchanged_permalink(template_permalink: TLShow, tmp_path, monkeypatch):
+    '''the second run only sends a HEAD request, since the ETag hasn't changed'''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'dest').mkdir()
+    with LocalServer(routes={'/audio.mp3': (200, {'ETag': '"v1"'}, make_audio(seconds=1))}) as server:
+        first = run_permalink(template_permalink, server, tmp_path)
+        second = run_permalink(template_permalink, server, tmp_path)
+    assert not first.unchanged and second.unchanged
+    assert second.output_file is None and second.transfers == []
+    assert [method for method, _, _ in server.requests] == ['HEAD', 'GET', 'HEAD']
+
+def test_skip_unchanged_permalink_changed(template_permalink: TLShow, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'dest').mkdir()
+    with LocalServer(routes={'/audio.mp3': (200, {'ETag': '"v1"'}, make_audio(seconds=1))}) as server:
+        run_permalink(template_permalink, server, tmp_path)
+        server.routes['/audio.mp3'] = (200, {'ETag': '"v2"'}, make_audio(seconds=2))
+        assert not run_permalink(template_permalink, server, tmp_path).unchanged
+
+def test_skip_unchanged_permalink_missing_from_destination(template_permalink: TLShow, tmp_path, monkeypatch):
+    '''if the file we delivered has gone, deliver it again'''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'dest').mkdir()
+    with LocalServer(routes={'/audio.mp3': (200, {'ETag': '"v1"'}, make_audio(seconds=1))}) as server:
+        first = run_permalink(template_permalink, server, tmp_path)
+        os.remove(tmp_path / 'dest' / first.output_file)
+        assert not run_permalink(template_permalink, server, tmp_path).unchanged
+
+def test_skip_unchanged_permalink_no_validators(template_permalink: TLShow, tmp_path, monkeypatch):
+    '''without an ETag or Last-Modified we can't tell, so always deliver'''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'dest').mkdir()
+    with LocalServer(routes={'/audio.mp3': (200, {}, make_audio(seconds=1))}) as server:
+        run_permalink(template_permalink, server, tmp_path)
+        assert not run_permalink(template_permalink, server, tmp_path).unchanged
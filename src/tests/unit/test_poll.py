@@ -0,0 +1,76 @@
+import time
+import pytest
+from unittest.mock import patch
+
+from talklib import TLShow, FeedPoller
+from ..mock import env_vars, LocalServer, make_audio, make_feed
+
+
+def slow_feed(handler):
+    time.sleep(0.3)
+    return 200, {}, make_feed()
+
+routes = {
+    '/slow.xml': (200, {}, slow_feed),
+    '/today.xml': (200, {}, make_feed()),
+    '/old.xml': (200, {}, b'<rss><channel><item><pubDate>Mon, 17 Oct 2022</pubDate><enclosure url="a.mp3"/></item></channel></rss>'),
+    '/broken.xml': (200, {}, b'not a feed'),
+}
+
+def make_show(url: str, **attributes) -> TLShow:
+    with patch.dict('os.environ', env_vars):
+        show = TLShow()
+    show.show = url
+    show.show_filename = 'delete_me'
+    show.url = url
+    show.notifications.enable_all = False
+    for key, value in attributes.items():
+        setattr(show, key, value)
+    return show
+
+@pytest.fixture
+def server():
+    with LocalServer(routes=routes) as server:
+        yield server
+
+
+def test_check_is_concurrent(server: LocalServer):
+    '''five feeds that each take 0.3 seconds should take about 0.3 seconds total'''
+    poller = FeedPoller(shows=[make_show(f'{server.url}/slow.xml') for _ in range(5)], limit_per_host=5)
+    start = time.monotonic()
+    statuses = poller.check()
+    assert time.monotonic() - start < 1
+    assert all(status.ready for status in statuses)
+
+def test_ready(server: LocalServer):
+    today = make_show(f'{server.url}/today.xml')
+    old = make_show(f'{server.url}/old.xml')
+    permalink = make_show(f'{server.url}/audio.mp3', is_permalink=True)
+    poller = FeedPoller(shows=[today, old, permalink], retry_delay=0)
+    assert poller.ready() == [today, permalink]
+
+def test_stale_feed_is_retried(server: LocalServer):
+    poller = FeedPoller(shows=[make_show(f'{server.url}/old.xml')], attempts=3, retry_delay=0)
+    status = poller.check()[0]
+    assert not status.ready
+    assert status.episode.pub_date == 'Mon, 17 Oct 2022'
+    assert len(server.requests) == 3
+
+def test_errors_are_isolated(server: LocalServer):
+    poller = FeedPoller(shows=[make_show(f'{server.url}/broken.xml'), make_show(f'{server.url}/today.xml')])
+    broken, today = poller.check()
+    assert not broken.ready and broken.error is not None
+    assert today.ready
+
+def test_run_after_poll_uses_polled_episode(server: LocalServer, tmp_path, monkeypatch):
+    '''polling then running a show fetches its feed once, not twice'''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'dest').mkdir()
+    server.routes['/feed.xml'] = (200, {}, make_feed(audio_url=f'{server.url}/audio.mp3'))
+    server.routes['/audio.mp3'] = (200, {}, make_audio(seconds=1))
+    show = make_show(f'{server.url}/feed.xml', destinations=[str(tmp_path / 'dest')], headless=True, use_feed_cache=False)
+    ready, = FeedPoller(shows=[show]).ready()
+    assert ready.polled_episode.url == f'{server.url}/audio.mp3'
+    ready.run()
+    assert [path for _, path, _ in server.requests] == ['/feed.xml', '/audio.mp3']
+    assert ready.polled_episode is None  # the next run checks the feed again
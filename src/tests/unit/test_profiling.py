@@ -0,0 +1,48 @@
+import tracemalloc
+from unittest.mock import patch
+
+from talklib.metrics import RunRecorder
+from talklib.profiling import StageProfiler
+
+
+def test_tracemalloc_shared(tmp_path):
+    '''one show finishing doesn't turn tracemalloc off under another that's mid-stage'''
+    first = StageProfiler(directory=str(tmp_path), name='first')
+    second = StageProfiler(directory=str(tmp_path), name='second')
+    first.start()
+    second.start()
+    recorder = RunRecorder(show='second', profiler=second)
+    with recorder.stage('convert'):
+        first.stop()
+        assert tracemalloc.is_tracing()
+    second.stop()
+    assert not tracemalloc.is_tracing()
+    assert recorder.record.stages[0].succeeded
+    assert list(tmp_path.glob('second-*-01-convert-memory.txt'))
+
+def test_tracemalloc_left_alone(tmp_path):
+    '''if something else started tracemalloc, it's still running when we're done'''
+    tracemalloc.start()
+    try:
+        profiler = StageProfiler(directory=str(tmp_path), name='show')
+        profiler.start()
+        profiler.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+def test_profiler_errors_never_fail_a_stage(tmp_path):
+    logged = []
+    profiler = StageProfiler(directory=str(tmp_path), name='show', log=logged.append)
+    profiler.start()
+    recorder = RunRecorder(show='show', profiler=profiler)
+    try:
+        with patch.object(tracemalloc, 'take_snapshot', side_effect=RuntimeError('not tracing')):
+            with recorder.stage('convert') as stage:
+                pass
+        with recorder.stage('copy'):
+            tracemalloc.stop()  # E.G. something else turned it off mid-stage
+    finally:
+        profiler.stop()
+    assert stage.succeeded and recorder.record.stages[1].succeeded
+    assert logged == ['Unable to profile convert: not tracing']
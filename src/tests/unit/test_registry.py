@@ -0,0 +1,27 @@
+import os
+from unittest.mock import patch
+
+from talklib import registry
+
+
+def test_per_process():
+    closed = []
+    first = registry.per_process(key=('test',), factory=list, close=closed.append)
+    assert registry.per_process(key=('test',), factory=list) is first
+    with patch.object(os, 'getpid', return_value=-1):  # E.G. a TLShowBatch worker process
+        assert registry.per_process(key=('test',), factory=list) is not first
+        registry.discard(key=('test',))
+    registry.discard(key=('test',))
+    assert closed == [first]
+    assert registry.per_process(key=('test',), factory=list) is not first
+    registry.discard(key=('test',))
+
+def test_close_all_closes_what_closing_makes():
+    '''closing one object can need another (E.G. a digest needs a mail connection). that one is closed too'''
+    closed = []
+    def close_first(first):
+        closed.append(first)
+        registry.per_process(key=('second',), factory=lambda: 'second', close=closed.append)
+    registry.per_process(key=('first',), factory=lambda: 'first', close=close_first)
+    registry.close_all()
+    assert closed == ['first', 'second']
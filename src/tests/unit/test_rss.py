@@ -2,7 +2,7 @@ import pytest
 from unittest.mock import patch
 
 from talklib import TLShow
-from ..mock import env_vars
+from ..mock import env_vars, LocalServer, make_audio, make_feed
 
 import xml.etree.ElementTree as ET
 
@@ -103,3 +103,66 @@ def test_check_attributes_are_valid_12(template_rss: TLShow):
     with pytest.raises(Exception):
         template_rss.run()
 
+
+
+# ---------- feed cache ----------
+
+def etag_feed(handler):
+    '''serve the feed with an ETag, and answer 304 if the client already has it'''
+    if handler.headers.get('If-None-Match') == '"v1"':
+        return 304, {'ETag': '"v1"'}, b''
+    return 200, {'ETag': '"v1"'}, make_feed()
+
+def test_get_feed_uses_conditional_request(template_rss: TLShow, tmp_path):
+    template_rss.cache_dir = str(tmp_path)
+    with LocalServer(routes={'/feed.xml': (200, {}, etag_feed)}) as server:
+        template_rss.url = f'{server.url}/feed.xml'
+        first = template_rss._TLShow__get_feed()
+        second = template_rss._TLShow__get_feed()
+    assert 'If-None-Match' not in server.requests[0][2]
+    assert server.requests[1][2]['If-None-Match'] == '"v1"'
+    assert ET.tostring(first) == ET.tostring(second)
+
+def test_get_feed_cache_disabled(template_rss: TLShow, tmp_path):
+    template_rss.cache_dir = str(tmp_path)
+    template_rss.use_feed_cache = False
+    with LocalServer(routes={'/feed.xml': (200, {}, etag_feed)}) as server:
+        template_rss.url = f'{server.url}/feed.xml'
+        template_rss._TLShow__get_feed()
+        template_rss._TLShow__get_feed()
+    assert 'If-None-Match' not in server.requests[1][2]
+    assert not any(tmp_path.iterdir())
+
+# ---------- fetch once ----------
+
+def test_feed_fetched_once_per_run(template_rss: TLShow):
+    '''checking the feed and then getting the audio URL should only fetch the feed once'''
+    template_rss.use_feed_cache = False
+    with LocalServer(routes={'/feed.xml': (200, {}, make_feed(audio_url='https://somesite.org/today.mp3'))}) as server:
+        template_rss.url = f'{server.url}/feed.xml'
+        assert template_rss._TLShow__check_feed_loop()
+        assert template_rss._TLShow__get_RSS_audio_url() == 'https://somesite.org/today.mp3'
+    assert len(server.requests) == 1
+
+# ---------- skip unchanged ----------
+
+def test_skip_unchanged_rss(template_rss: TLShow, tmp_path, monkeypatch):
+    '''the same newest episode twice: the second run doesn't download it'''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'dest').mkdir()
+    template_rss.destinations = [str(tmp_path / 'dest')]
+    template_rss.cache_dir = str(tmp_path / 'cache')
+    template_rss.headless = True
+    template_rss.skip_unchanged = True
+    with LocalServer() as server:
+        server.routes['/feed.xml'] = (200, {}, make_feed(audio_url=f'{server.url}/audio.mp3'))
+        server.routes['/audio.mp3'] = (200, {}, make_audio(seconds=1))
+        template_rss.url = f'{server.url}/feed.xml'
+        first = template_rss.run()
+        second = template_rss.run()
+        server.routes['/feed.xml'] = (200, {}, make_feed(audio_url=f'{server.url}/audio.mp3?v=2'))
+        server.routes['/audio.mp3?v=2'] = server.routes['/audio.mp3']
+        third = template_rss.run()
+    assert (first.unchanged, second.unchanged, third.unchanged) == (False, True, False)
+    downloads = [path for method, path, _ in server.requests if path.startswith('/audio.mp3')]
+    assert downloads == ['/audio.mp3', '/audio.mp3?v=2']
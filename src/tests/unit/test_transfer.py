@@ -0,0 +1,81 @@
+import hashlib
+import os
+import time
+import pytest
+from unittest.mock import patch
+
+from talklib import transfer
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'show.wav'
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 5))
+    return str(path)
+
+@pytest.fixture
+def destinations(tmp_path):
+    folders = [tmp_path / f'dest{number}' for number in range(3)]
+    for folder in folders:
+        folder.mkdir()
+    return [str(folder) for folder in folders]
+
+@pytest.fixture(params=[True, False], ids=['fast copy', 'fan out'])
+def fast_copy(request):
+    '''run each test with the kernel copy and with the read-once fan-out copy'''
+    if request.param and not transfer.FAST_COPY:
+        pytest.skip('copy_file_range is not available here')
+    with patch.object(transfer, 'FAST_COPY', request.param):
+        yield request.param
+
+
+def test_copy_to_destinations(source, destinations, fast_copy):
+    results = transfer.copy_to_destinations(source=source, destinations=destinations)
+    with open(source, 'rb') as original:
+        expected = hashlib.sha256(original.read()).hexdigest()
+    assert [result.destination for result in results] == destinations
+    for result in results:
+        assert result.succeeded
+        assert (result.bytes, result.digest) == (os.path.getsize(source), expected)
+        assert transfer.file_digest(os.path.join(result.destination, 'show.wav'))[1] == expected
+        assert os.listdir(result.destination) == ['show.wav']  # no temporary files left behind
+
+def test_source_read_once(source, destinations):
+    '''the fan-out copy should read the source exactly once, however many destinations there are'''
+    opened = []
+    real_open = open
+    def watched_open(path, *args, **kwargs):
+        if path == source:
+            opened.append(path)
+        return real_open(path, *args, **kwargs)
+    with patch.object(transfer, 'FAST_COPY', False), patch('builtins.open', watched_open):
+        transfer.copy_to_destinations(source=source, destinations=destinations)
+    assert len(opened) == 1
+
+def test_copy_is_concurrent(source, destinations):
+    '''three copies that each take 0.3 seconds should take about 0.3 seconds total'''
+    real_copy = transfer._kernel_copy
+    def slow_copy(*args):
+        time.sleep(0.3)
+        return real_copy(*args)
+    with patch.object(transfer, 'FAST_COPY', True), patch.object(transfer, '_kernel_copy', slow_copy):
+        start = time.monotonic()
+        transfer.copy_to_destinations(source=source, destinations=destinations)
+    assert time.monotonic() - start < 0.8
+
+def test_truncated_copy_is_rejected(source, destinations):
+    '''a copy that doesn't match the source should never be renamed into place'''
+    def truncated_copy(src, dst):
+        with open(src, 'rb') as original, open(dst, 'wb') as copy:
+            copy.write(original.read()[:1000])
+    with patch.object(transfer, 'FAST_COPY', True), patch.object(transfer, '_kernel_copy', truncated_copy):
+        results = transfer.copy_to_destinations(source=source, destinations=destinations)
+    for result in results:
+        assert not result.succeeded
+        assert os.listdir(result.destination) == []
+
+def test_failed_destination_is_isolated(source, destinations, fast_copy):
+    destinations.insert(1, os.path.join(destinations[0], 'does_not_exist'))
+    results = transfer.copy_to_destinations(source=source, destinations=destinations)
+    assert [result.succeeded for result in results] == [True, False, True, True]
+    assert isinstance(results[1].error, OSError)
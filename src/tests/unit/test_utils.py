@@ -27,4 +27,18 @@ def test_send_sms():
 def test_send_call():
     'should raise error if argument not passed'
     with pytest.raises(TypeError):
-        Notify.send_call()
\ No newline at end of file
+        Notify.send_call()
+def test_metadata_to_icecast_config_file(tmp_path):
+    '''the Icecast login can come from the config file, like everything else'''
+    from talklib.ev import EV
+    config = tmp_path / 'talklib.toml'
+    config.write_text('\n'.join(f'{key} = "{value}"' for key, value in env_vars.items()))
+    try:
+        with patch.dict('os.environ', {'talklib_config': str(config)}, clear=True):
+            EV.reload()
+        with patch.object(utils, 'Notify'), patch.object(utils.requests, 'get', return_value=MagicMock(status_code=200)) as get:
+            utils.metadata_to_icecast(title='Delete Me')
+        assert get.call_args.kwargs['auth'] == (env_vars['icecast_user'], env_vars['icecast_pass'])
+    finally:
+        with patch.dict('os.environ', env_vars):
+            EV.reload()
@@ -0,0 +1,80 @@
+import math
+import struct
+import sys
+import wave
+import pytest
+from unittest.mock import patch
+
+from talklib import wav
+from ..mock import make_audio
+
+
+def write_wav(path, frames: bytes, sample_rate: int = 8000, channels: int = 1, width: int = 2) -> str:
+    with wave.open(str(path), 'wb') as file:
+        file.setnchannels(channels)
+        file.setsampwidth(width)
+        file.setframerate(sample_rate)
+        file.writeframes(frames)
+    return str(path)
+
+def pcm16(*samples: int) -> bytes:
+    return struct.pack(f'<{len(samples)}h', *samples)
+
+
+def test_read_header_ffmpeg(tmp_path):
+    '''the same kind of file FFMPEG.convert makes'''
+    path = tmp_path / 'tone.wav'
+    path.write_bytes(make_audio(seconds=3, format='wav'))
+    info = wav.read_header(str(path))
+    assert (info.sample_rate, info.channels, info.bits_per_sample) == (44100, 1, 16)
+    assert info.duration == 3.0
+    assert info.frames == 3 * 44100  # written to a pipe, so the header has no size. the wave module can't tell.
+
+def test_read_header_stereo(tmp_path):
+    path = write_wav(tmp_path / 'stereo.wav', pcm16(*[0] * 16000), channels=2)
+    info = wav.read_header(path)
+    assert info.frames == 8000 and info.duration == 1.0
+
+def test_read_header_unknown_size(tmp_path):
+    '''a WAV written to a pipe has 0xFFFFFFFF as its size. Go by the file instead.'''
+    path = write_wav(tmp_path / 'piped.wav', pcm16(*[0] * 4000))
+    data = bytearray(open(path, 'rb').read())
+    offset = data.index(b'data') + 4
+    data[offset:offset + 4] = b'\xff\xff\xff\xff'
+    open(path, 'wb').write(bytes(data))
+    assert wav.read_header(path).duration == 0.5
+
+def test_read_header_not_wav(tmp_path):
+    path = tmp_path / 'tone.mp3'
+    path.write_bytes(make_audio(seconds=1))
+    with pytest.raises(ValueError):
+        wav.read_header(str(path))
+    (tmp_path / 'empty.wav').write_bytes(b'')
+    with pytest.raises(ValueError):
+        wav.read_header(str(tmp_path / 'empty.wav'))
+
+def test_analyze(tmp_path):
+    pytest.importorskip('numpy')
+    tone = [round(32767 * math.sin(2 * math.pi * 440 * n / 8000)) for n in range(8000)]
+    tone[100] = tone[200] = -32768  # two clipped samples
+    path = write_wav(tmp_path / 'test.wav', pcm16(*[0] * 8000, *tone, *[0] * 4000))
+    stats = wav.analyze(path, block_frames=3000)  # blocks smaller than the file, to check they add up
+    assert stats.duration == 2.5
+    assert stats.peak == 1.0
+    assert stats.clipped >= 2
+    assert stats.leading_silence == pytest.approx(1.0, abs=0.01)
+    assert stats.trailing_silence == pytest.approx(0.5, abs=0.01)
+    assert stats.rms_dbfs == pytest.approx(-3.0 - 10 * math.log10(2.5), abs=0.1)  # a sine is 3 dB below its peak, for 1 of 2.5 seconds
+
+def test_analyze_silence(tmp_path):
+    pytest.importorskip('numpy')
+    path = write_wav(tmp_path / 'silence.wav', pcm16(*[0] * 800))
+    stats = wav.analyze(path)
+    assert stats.peak == 0 and stats.peak_dbfs == -math.inf
+    assert stats.leading_silence == stats.trailing_silence == 0.1
+
+def test_analyze_without_numpy(tmp_path):
+    path = write_wav(tmp_path / 'silence.wav', pcm16(0, 0))
+    with patch.dict(sys.modules, {'numpy': None}):
+        with pytest.raises(ImportError):
+            wav.analyze(path)